@@ -0,0 +1,120 @@
+"""
+Live admin dashboard feed for GET /admin/stream.
+
+AdminFeed listens to every todo and account event on this worker's hub
+(events.py), including events relayed from other workers. Changes only mark
+the feed dirty. At most ADMIN_FEED_MAX_RATE times a second, and only while
+an admin stream is open, one task recomputes the stats, diffs them against
+the last broadcast, and sends every open stream a single `delta` event. The
+event carries the changed counters and the recent changes.
+
+New streams start with a `snapshot` of the full stats. A stream that falls
+behind gets `resync`, like the todo streams.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from todoApp.events import HEARTBEAT_SECONDS, Subscription, todo_events
+
+ADMIN_FEED_MAX_RATE = float(os.environ.get('ADMIN_FEED_MAX_RATE', '2'))
+# Changes beyond this many per update are summarised by the stat deltas.
+RECENT_LIMIT = 20
+
+
+class AdminFeed:
+    def __init__(self, stats):
+        self.stats = stats
+        self.last_stats = None
+        self._subscriptions = set()
+        self._recent = []
+        self._lock = threading.Lock()
+        self._dirty = None
+        self._loop = None
+        self._task = None
+
+    def _on_event(self, owner_id, event):
+        change = {'type': event['type'], 'id': event['id']}
+        if owner_id is not None:
+            change = {'type': f"todo_{event['type']}", 'id': event['id'], 'owner_id': owner_id}
+        with self._lock:
+            if not self._subscriptions:
+                return
+            self._recent.append(change)
+            del self._recent[:-RECENT_LIMIT]
+        self._loop.call_soon_threadsafe(self._dirty.set)
+
+    @property
+    def running(self):
+        """Whether start() has run; only then do streams get deltas."""
+        return self._task is not None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._dirty = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        todo_events.hub.add_listener(self._on_event)
+
+    async def stop(self):
+        todo_events.hub.remove_listener(self._on_event)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        interval = 1 / ADMIN_FEED_MAX_RATE
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            started = time.monotonic()
+            with self._lock:
+                recent, self._recent = self._recent, []
+            stats = await run_in_threadpool(self.stats)
+            previous, self.last_stats = self.last_stats, stats
+            deltas = {name: value - previous.get(name, 0) for name, value in stats.items()
+                      if previous is not None and value != previous.get(name)}
+            if deltas or recent:
+                self._broadcast({'type': 'delta', 'stats': deltas, 'changes': recent})
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def _broadcast(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.offer(event)
+
+    async def stream(self):
+        """SSE body: a snapshot, then coalesced deltas and heartbeats until the admin leaves."""
+        subscription = Subscription(None)
+        # Deltas build on the last broadcast, so that is what a new stream
+        # starts from; the delta this connect triggers brings it up to date.
+        if self.last_stats is None:
+            self.last_stats = await run_in_threadpool(self.stats)
+        snapshot = self.last_stats
+        with self._lock:
+            self._subscriptions.add(subscription)
+        self._dirty.set()
+        try:
+            yield 'retry: 5000\n\n'
+            yield f'event: snapshot\ndata: {json.dumps(snapshot)}\n\n'
+            while True:
+                try:
+                    event = await subscription.get(HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+        finally:
+            with self._lock:
+                self._subscriptions.discard(subscription)
+                if not self._subscriptions:
+                    # Nobody is tracking deltas; the next stream starts fresh.
+                    self.last_stats = None
@@ -0,0 +1,34 @@
+"""Add prefix search indexes on users
+
+Revision ID: a9d4e2f61c37
+Revises: f7a1c3e9b254
+Create Date: 2026-10-18 16:42:31.508214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d4e2f61c37'
+down_revision: Union[str, Sequence[str], None] = 'f7a1c3e9b254'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # text_pattern_ops lets lower(col) LIKE 'prefix%' use the index under any collation.
+    op.execute("CREATE INDEX ix_users_username_lower ON users (lower(username) text_pattern_ops)")
+    op.execute("CREATE INDEX ix_users_email_lower ON users (lower(email) text_pattern_ops)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_users_email_lower")
+    op.execute("DROP INDEX IF EXISTS ix_users_username_lower")
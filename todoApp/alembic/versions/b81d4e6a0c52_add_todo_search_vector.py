@@ -0,0 +1,39 @@
+"""Add full-text search vector to todos
+
+Revision ID: b81d4e6a0c52
+Revises: 3c1f0a9e2b7d
+Create Date: 2026-10-18 10:03:17.552940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81d4e6a0c52'
+down_revision: Union[str, Sequence[str], None] = '3c1f0a9e2b7d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # IF NOT EXISTS: databases that older app versions already indexed at startup.
+    op.execute("""
+        ALTER TABLE todos ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, ''))
+        ) STORED
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_todos_search_vector ON todos USING gin (search_vector)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_todos_search_vector")
+    op.execute("ALTER TABLE todos DROP COLUMN IF EXISTS search_vector")
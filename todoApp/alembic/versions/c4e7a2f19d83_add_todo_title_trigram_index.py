@@ -0,0 +1,35 @@
+"""Add trigram index on todo titles
+
+Revision ID: c4e7a2f19d83
+Revises: b81d4e6a0c52
+Create Date: 2026-10-18 11:20:05.114627
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e7a2f19d83'
+down_revision: Union[str, Sequence[str], None] = 'b81d4e6a0c52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # btree_gin lets owner_id share the GIN index, so suggestions stay owner-scoped.
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    # IF NOT EXISTS: databases that older app versions already indexed at startup.
+    op.execute("CREATE INDEX IF NOT EXISTS ix_todos_owner_title_trgm ON todos USING gin (owner_id, title gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_todos_owner_title_trgm")
@@ -0,0 +1,28 @@
+"""Add version to todos
+
+Revision ID: d5a93b07e1c4
+Revises: c4e7a2f19d83
+Create Date: 2026-10-18 12:41:52.870316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a93b07e1c4'
+down_revision: Union[str, Sequence[str], None] = 'c4e7a2f19d83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('todos', sa.Column('version', sa.Integer, nullable=False, server_default='1'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('todos', 'version')
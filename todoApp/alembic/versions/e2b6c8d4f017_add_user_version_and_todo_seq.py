@@ -0,0 +1,30 @@
+"""Add version and todo_seq to users
+
+Revision ID: e2b6c8d4f017
+Revises: d5a93b07e1c4
+Create Date: 2026-10-18 13:55:09.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b6c8d4f017'
+down_revision: Union[str, Sequence[str], None] = 'd5a93b07e1c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('version', sa.Integer, nullable=False, server_default='1'))
+    op.add_column('users', sa.Column('todo_seq', sa.Integer, nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'todo_seq')
+    op.drop_column('users', 'version')
@@ -0,0 +1,44 @@
+"""Add todo change tracking for delta sync
+
+Revision ID: f7a1c3e9b254
+Revises: e2b6c8d4f017
+Create Date: 2026-10-19 09:12:40.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7a1c3e9b254'
+down_revision: Union[str, Sequence[str], None] = 'e2b6c8d4f017'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('todos', sa.Column('seq', sa.Integer, nullable=False, server_default='0'))
+    op.add_column('todos', sa.Column('updated_at', sa.DateTime(timezone=True)))
+    op.create_index('ix_todos_owner_seq', 'todos', ['owner_id', 'seq'])
+
+    op.create_table(
+        'todo_tombstones',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('owner_id', sa.Integer, nullable=False),
+        sa.Column('todo_id', sa.Integer, nullable=False),
+        sa.Column('seq', sa.Integer, nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True)),
+    )
+    op.create_index('ix_todo_tombstones_owner_seq', 'todo_tombstones', ['owner_id', 'seq'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_todo_tombstones_owner_seq', table_name='todo_tombstones')
+    op.drop_table('todo_tombstones')
+    op.drop_index('ix_todos_owner_seq', table_name='todos')
+    op.drop_column('todos', 'updated_at')
+    op.drop_column('todos', 'seq')
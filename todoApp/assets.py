@@ -0,0 +1,153 @@
+"""
+Fingerprinted, precompressed static assets.
+
+Build step (run once per deploy, see the Dockerfile):
+
+    python -m todoApp.assets
+
+copies every file under todoApp/static into todoApp/static/dist with a
+content hash in its name (css/bootstrap.css -> css/bootstrap.3f2a9c1b7d0e.css),
+writes .gz and .br siblings for text assets, and records the mapping in
+dist/manifest.json.
+
+Templates call static_url('css/bootstrap.css'), which resolves through the
+manifest. PrecompressedStaticFiles serves the .br/.gz sibling the client
+accepts and marks hashed files immutable, so repeat visits never refetch
+them. Without a build the original files are served as before.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from pathlib import Path
+
+from fastapi.staticfiles import StaticFiles
+from jinja2 import pass_context
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+from todoApp.compression import accepted_encodings, brotli
+
+STATIC_DIR = Path(__file__).parent / 'static'
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+
+# Source maps keep their names: the bundles point at them by name.
+_UNHASHED = ('.map',)
+_COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html')
+# Below this a compressed sibling saves less than its extra headers cost.
+_MIN_COMPRESS_SIZE = 256
+
+
+def _hashed_name(path: Path, content: bytes):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return path.with_name(f'{path.stem}.{digest}{path.suffix}')
+
+
+def _write_compressed(target: Path, content: bytes):
+    if target.suffix not in _COMPRESSIBLE or len(content) < _MIN_COMPRESS_SIZE:
+        return
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    for suffix, data in variants.items():
+        if len(data) < len(content):
+            target.with_name(target.name + suffix).write_bytes(data)
+
+
+def build(source: Path = STATIC_DIR):
+    """Rebuild source/dist and return the manifest {original: hashed}."""
+    dist = source / DIST
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    for path in sorted(source.rglob('*')):
+        if not path.is_file() or dist in path.parents:
+            continue
+        relative = path.relative_to(source)
+        content = path.read_bytes()
+        hashed = relative if relative.suffix in _UNHASHED else _hashed_name(relative, content)
+        target = dist / hashed
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+        _write_compressed(target, content)
+        if hashed != relative:
+            manifest[relative.as_posix()] = f'{DIST}/{hashed.as_posix()}'
+    (dist / MANIFEST).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+def load_manifest(source: Path = STATIC_DIR):
+    try:
+        return json.loads((source / DIST / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+manifest = load_manifest()
+
+
+def static_path(path: str):
+    """Path under /static to link for path, the hashed copy when one was built."""
+    path = path.lstrip('/')
+    return manifest.get(path, path)
+
+
+@pass_context
+def static_url(context, path: str):
+    """Jinja global: {{ static_url('css/base.css') }}."""
+    return context['request'].url_for('static', path=static_path(path))
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that prefers .br/.gz siblings and caches hashed files forever."""
+
+    def __init__(self, *, directory, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.immutable = frozenset(load_manifest(Path(directory)).values())
+
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 206, 304):
+            hashed = Path(path).as_posix() in self.immutable
+            response.headers['cache-control'] = IMMUTABLE if hashed else REVALIDATE
+        return response
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get('accept-encoding'))
+        path = os.fspath(full_path)
+        media_type = mimetypes.guess_type(path)[0] or 'text/plain'
+
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if candidate in accepted and os.path.isfile(path + suffix):
+                encoding, path = candidate, path + suffix
+                stat_result = os.stat(path)
+                break
+
+        response = FileResponse(path, status_code=status_code, stat_result=stat_result, media_type=media_type)
+        response.headers['vary'] = 'Accept-Encoding'
+        if encoding is not None:
+            response.headers['content-encoding'] = encoding
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', type=Path, default=STATIC_DIR)
+    args = parser.parse_args()
+    built = build(args.source)
+    print(f'{len(built)} assets fingerprinted into {args.source / DIST}')
+
+
+if __name__ == '__main__':
+    main()
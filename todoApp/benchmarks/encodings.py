@@ -0,0 +1,66 @@
+"""
+Compare JSON, MessagePack and CBOR for todo list payloads.
+
+Reports body size (raw and gzipped) plus encode and decode time for each
+encoding the server can negotiate. CBOR is skipped if cbor2 is not installed.
+
+Usage:
+    python -m todoApp.benchmarks.encodings --sizes 100 1000 10000
+"""
+import argparse
+import gzip
+import json
+import time
+
+import msgpack
+import orjson
+
+from todoApp.negotiation import cbor2
+from todoApp.schemas import TodoResponse, rows_as_dicts
+
+
+def _payload(n: int):
+    rows = [
+        (i, f'Todo number {i}', f'Realistic description text for item {i}, about this long.',
+         1 + i % 5, i % 3 == 0, 1 + i % 50, 1 + i % 4)
+        for i in range(1, n + 1)
+    ]
+    return rows_as_dicts(rows, TodoResponse)
+
+
+def _best_of(fn, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    codecs = {
+        'json (orjson)': (orjson.dumps, orjson.loads),
+        'json (stdlib)': (lambda c: json.dumps(c).encode(), json.loads),
+        'msgpack': (lambda c: msgpack.packb(c, use_bin_type=True), msgpack.unpackb),
+    }
+    if cbor2 is not None:
+        codecs['cbor'] = (cbor2.dumps, cbor2.loads)
+
+    print(f'{"items":>7}  {"encoding":<15}{"bytes":>11}{"gzipped":>10}{"encode ms":>11}{"decode ms":>11}')
+    for n in args.sizes:
+        payload = _payload(n)
+        for name, (encode, decode) in codecs.items():
+            body = encode(payload)
+            encode_ms = _best_of(lambda: encode(payload), args.repeat)
+            decode_ms = _best_of(lambda: decode(body), args.repeat)
+            print(f'{n:>7}  {name:<15}{len(body):>11,}{len(gzip.compress(body)):>10,}'
+                  f'{encode_ms:>11.2f}{decode_ms:>11.2f}')
+
+
+if __name__ == '__main__':
+    main()
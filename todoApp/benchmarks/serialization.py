@@ -0,0 +1,66 @@
+"""
+Time the ways a todo list can be turned into a JSON response body.
+
+* orm + jsonable_encoder: what FastAPI did when handlers returned ORM
+  objects with no response_model (jsonable_encoder, then json.dumps)
+* orm + response_model: pydantic validation from attributes, then orjson
+* rows + orjson: the current hot path, column tuples -> dicts -> orjson
+
+Runs without a database: rows are built in memory.
+
+Usage:
+    python -m todoApp.benchmarks.serialization --sizes 1000 10000
+"""
+import argparse
+import json
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from todoApp.models import Todos
+from todoApp.schemas import TodoResponse, rows_as_dicts
+
+
+def _rows(n: int):
+    return [
+        (i, f'todo {i}', f'description for todo number {i}', 1 + i % 5, i % 3 == 0, 1 + i % 50, 1)
+        for i in range(1, n + 1)
+    ]
+
+
+def _orm(rows):
+    fields = tuple(TodoResponse.model_fields)
+    return [Todos(**dict(zip(fields, row))) for row in rows]
+
+
+def _best_of(fn, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    adapter = TypeAdapter(list[TodoResponse])
+    print(f'{"items":>8}{"orm+jsonable_encoder":>24}{"orm+response_model":>22}{"rows+orjson":>14}')
+    for n in args.sizes:
+        rows = _rows(n)
+        objects = _orm(rows)
+        legacy = _best_of(lambda: json.dumps(jsonable_encoder(objects)).encode(), args.repeat)
+        validated = _best_of(lambda: orjson.dumps(adapter.dump_python(adapter.validate_python(objects), mode='json')),
+                             args.repeat)
+        fast = _best_of(lambda: orjson.dumps(rows_as_dicts(rows, TodoResponse)), args.repeat)
+        print(f'{n:>8}{legacy:>21.1f} ms{validated:>19.1f} ms{fast:>11.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+"""
+Read-through caches for todo data.
+
+todo_cache holds per-user todo lists and single todos; admin_cache holds the
+admin dashboard aggregates (see SingleFlightCache).
+
+Entries live in an in-process LRU with a TTL and a size bound. An optional
+shared backend (anything with get/set/delete over bytes, e.g. a Redis
+client wrapper) can sit behind it so workers share fills; LocalSharedBackend
+is the in-memory stand-in used when no real one is configured.
+
+Every write path must call invalidate_todos() / invalidate_user() after
+committing; they also broadcast the keys to the other workers.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.concurrency import run_in_threadpool
+
+from todoApp.database import SessionLocal
+from todoApp.invalidation import invalidation_bus
+from todoApp.search import suggestion_cache
+from todoApp.timing import checkout
+
+CACHE_TTL = float(os.environ.get('TODO_CACHE_TTL', '30'))
+CACHE_SIZE = int(os.environ.get('TODO_CACHE_SIZE', '10000'))
+CACHE_BACKEND = os.environ.get('TODO_CACHE_BACKEND', '')
+# Admin aggregates are served fresh for ADMIN_CACHE_TTL seconds, then served
+# stale (while one request recomputes them) for up to ADMIN_CACHE_STALE_TTL.
+ADMIN_CACHE_TTL = float(os.environ.get('ADMIN_CACHE_TTL', '5'))
+ADMIN_CACHE_STALE_TTL = float(os.environ.get('ADMIN_CACHE_STALE_TTL', '30'))
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe LRU with a per-entry TTL and hit/miss/eviction counters."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float | None = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class LocalSharedBackend:
+    """In-memory stand-in for a shared cache server, same bytes-in/bytes-out contract."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._data.pop(key, None)
+                return None
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+class TodoCache:
+    """Local LRU in front of an optional shared backend."""
+
+    def __init__(self, local: LRUCache, shared=None):
+        self.local = local
+        self.shared = shared
+        self.shared_hits = 0
+
+    def get(self, key: str):
+        value = self.local.get(key)
+        if value is not None or self.shared is None:
+            return value
+        raw = self.shared.get(key)
+        if raw is None:
+            return None
+        self.shared_hits += 1
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, json.dumps(value).encode(), self.local.ttl)
+
+    def delete(self, *keys: str):
+        self.local.delete(*keys)
+        if self.shared is not None:
+            self.shared.delete(*keys)
+
+    def stats(self):
+        return {
+            **self.local.stats(),
+            'shared_backend': type(self.shared).__name__ if self.shared is not None else None,
+            'shared_hits': self.shared_hits,
+        }
+
+
+class SingleFlightCache:
+    """
+    Async TTL cache with request coalescing and stale-while-revalidate.
+
+    Concurrent misses for a key await one shared computation instead of each
+    hitting the database. Once an entry is older than `ttl` it is still
+    returned for up to `stale_ttl` more seconds while a single background
+    task recomputes it. `compute` is a blocking callable run in the threadpool;
+    with a session_factory it is called as compute(db) with a fresh session.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, session_factory=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.session_factory = session_factory
+        self._entries = {}
+        self._inflight = {}
+        self._generation = 0
+        self._loop = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.computations = 0
+
+    async def get(self, key: str, compute):
+        self._loop = asyncio.get_running_loop()
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            fresh_until, value = entry
+            if now < fresh_until:
+                self.hits += 1
+                return value
+            if now < fresh_until + self.stale_ttl:
+                self.stale_hits += 1
+                self._refresh(key, compute)
+                return value
+        self.misses += 1
+        # shield: a client disconnecting must not cancel everyone else's result.
+        return await asyncio.shield(self._refresh(key, compute))
+
+    def _refresh(self, key: str, compute):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, compute, self._generation))
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self._inflight[key] = task
+        return task
+
+    async def _compute(self, key: str, compute, generation: int):
+        self.computations += 1
+        value = await run_in_threadpool(self.run, compute)
+        # Skip the store if invalidate() ran while we were computing.
+        if generation == self._generation:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def run(self, compute):
+        """Call compute uncached, with a session of its own when the cache has a factory."""
+        if self.session_factory is None:
+            return compute()
+        with self.session_factory() as db:
+            checkout(db)
+            return compute(db)
+
+    def _finished(self, key: str, task):
+        # invalidate() may have let a newer computation take the key; leave that one be.
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Cache computation failed', exc_info=task.exception())
+
+    def invalidate(self, *keys: str):
+        """Drop keys, or every entry; callable from any thread, the work happens on the event loop."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is not loop:
+                try:
+                    loop.call_soon_threadsafe(self._invalidate, keys)
+                    return
+                except RuntimeError:
+                    pass  # The loop closed meanwhile; nothing can be reading the cache.
+        self._invalidate(keys)
+
+    def _invalidate(self, keys):
+        # Computations already running may have read the old rows: none of them may store.
+        self._generation += 1
+        if not keys:
+            self._entries.clear()
+            self._inflight.clear()
+        for key in keys:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_ratio': round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            'computations': self.computations,
+            'ttl': self.ttl,
+            'stale_ttl': self.stale_ttl,
+        }
+
+
+def todo_list_key(owner_id: int):
+    return f'todos:{owner_id}'
+
+
+def todo_key(owner_id: int, todo_id: int):
+    return f'todo:{owner_id}:{todo_id}'
+
+
+def todo_seq_key(owner_id: int):
+    return f'todoseq:{owner_id}'
+
+
+def user_key(user_id: int):
+    return f'user:{user_id}'
+
+
+todo_cache = TodoCache(
+    LRUCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL),
+    LocalSharedBackend() if CACHE_BACKEND == 'local' else None,
+)
+
+admin_cache = SingleFlightCache(ttl=ADMIN_CACHE_TTL, stale_ttl=ADMIN_CACHE_STALE_TTL, session_factory=SessionLocal)
+
+
+# admin_cache entries that read todos and users, respectively.
+ADMIN_TODO_KEYS = ('todos', 'stats')
+ADMIN_USER_KEYS = ('users', 'stats')
+
+
+def invalidate_todos(owner_id: int, todo_id: int | None = None):
+    """Drop everything cached for the owner's list (and one todo, if given) and the admin aggregates."""
+    keys = [todo_list_key(owner_id), todo_seq_key(owner_id)]
+    if todo_id is not None:
+        keys.append(todo_key(owner_id, todo_id))
+    todo_cache.delete(*keys)
+    suggestion_cache.invalidate(owner_id)
+    admin_cache.invalidate(*ADMIN_TODO_KEYS)
+    invalidation_bus.publish(*keys, f'suggest:{owner_id}', *(f'admin:{key}' for key in ADMIN_TODO_KEYS))
+
+
+def invalidate_user(user_id: int):
+    """Drop the cached user and the admin aggregates; call after creating a user too."""
+    todo_cache.delete(user_key(user_id))
+    admin_cache.invalidate(*ADMIN_USER_KEYS)
+    invalidation_bus.publish(user_key(user_id), *(f'admin:{key}' for key in ADMIN_USER_KEYS))
+
+
+@invalidation_bus.subscribe
+def _evict_remote(keys: list):
+    """
+    Another worker wrote: drop our local copies (the shared backend is already clean).
+
+    Runs on the bus's listener thread; admin_cache.invalidate() hands its
+    part to the event loop.
+    """
+    if '*' in keys:
+        todo_cache.local.clear()
+        suggestion_cache.clear()
+        admin_cache.invalidate()
+        return
+    admin_keys = [key.split(':', 1)[1] for key in keys if key.startswith('admin:')]
+    if admin_keys:
+        admin_cache.invalidate(*admin_keys)
+    todo_cache.local.delete(*keys)
+    for key in keys:
+        if key.startswith('suggest:'):
+            suggestion_cache.invalidate(int(key.split(':', 1)[1]))
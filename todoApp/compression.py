@@ -0,0 +1,78 @@
+"""
+Response compression for dynamic responses.
+
+CompressionMiddleware picks brotli or gzip from Accept-Encoding and
+compresses bodies of at least COMPRESSION_MIN_SIZE bytes. Brotli is used only
+when the optional brotli package is installed. Responses that already carry a
+Content-Encoding (the precompressed static files in assets.py) and event
+streams pass through untouched.
+"""
+import os
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '500'))
+# Dynamic responses trade ratio for latency; static assets are compressed at
+# the maximum levels at build time instead.
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4'))
+
+
+def accepted_encodings(accept_encoding: str | None):
+    """Content codings the client accepts (q > 0), lower-cased."""
+    accepted = set()
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = 'br'
+
+    def __init__(self, app, minimum_size: int, quality: int = BROTLI_QUALITY):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if more_body:
+            # flush() so streamed chunks reach the client as they are produced.
+            return self.compressor.process(body) + self.compressor.flush()
+        return self.compressor.process(body) + self.compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE,
+                 gzip_level: int = GZIP_LEVEL, brotli_quality: int = BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get('accept-encoding'))
+        if brotli is not None and 'br' in accepted:
+            responder = BrotliResponder(self.app, self.minimum_size, quality=self.brotli_quality)
+        elif 'gzip' in accepted:
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
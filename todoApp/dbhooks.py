@@ -0,0 +1,60 @@
+"""
+The engine-wide cursor listeners behind every per-statement measurement.
+
+Server-Timing (timing.py), the query log (querylog.py) and tracing
+(tracing.py) each register a watcher with on_statement(). Before a statement
+runs, each watcher is asked whether it wants it: watcher(conn, statement)
+returns None to pass, or a callback for when it finishes. Only when at least
+one watcher asks is anything pushed on the connection. The hook then reads
+the clock once on each side and calls every callback with
+(statement, seconds, error). error is the exception when the statement
+failed, else None.
+
+With no timed, logged or traced request and no capture_queries() block, a
+statement costs one context variable lookup per watcher.
+"""
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_watchers = []
+
+
+def on_statement(watcher):
+    """Register watcher(conn, statement) -> callback(statement, seconds, error) or None."""
+    _watchers.append(watcher)
+    return watcher
+
+
+def _finish(conn, execution_context, statement, error):
+    pending = conn.info.get('statements')
+    # Only statements a watcher asked for were pushed; leave the stack alone for the rest.
+    if not pending or pending[-1][0] is not execution_context:
+        return
+    _, started, callbacks = pending.pop()
+    seconds = time.perf_counter() - started
+    for callback in callbacks:
+        callback(statement, seconds, error)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    callbacks = []
+    for watcher in _watchers:
+        callback = watcher(conn, statement)
+        if callback is not None:
+            callbacks.append(callback)
+    if callbacks:
+        conn.info.setdefault('statements', []).append((context, time.perf_counter(), callbacks))
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _finish(conn, context, statement, None)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    if context.connection is not None:
+        _finish(context.connection, context.execution_context, context.statement, context.original_exception)
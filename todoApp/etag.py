@@ -0,0 +1,60 @@
+"""
+Strong ETags and conditional GET helpers.
+
+ETags are built from counters that change on every write (a todo's version,
+a user's profile version, a user's todo change sequence), so a handler can
+answer If-None-Match from one integer without loading or serializing rows.
+Per-user resources put the user's id in the ETag as well, and responses vary
+on the credentials. Otherwise a second user in the same browser could
+revalidate against the first user's cached copy and be shown it.
+"""
+from fastapi import Request, Response
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from todoApp.models import Users
+from todoApp.negotiation import JSON, preferred_encoding
+
+# Clients must revalidate every time, but may keep the body they have.
+CACHE_CONTROL = 'private, no-cache'
+VARY = 'Accept, Authorization, Cookie'
+
+
+def make_etag(*parts):
+    """Quoted ETag; non-JSON representations get the encoding appended (e.g. "3-msgpack")."""
+    encoding = preferred_encoding()
+    if encoding != JSON:
+        parts = (*parts, encoding)
+    return '"' + '-'.join(str(part) for part in parts) + '"'
+
+
+def etag_matches(request: Request, etag: str):
+    """True if If-None-Match names etag (weak comparison, as RFC 9110 asks for GET)."""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+
+def etag_headers(etag: str):
+    return {'ETag': etag, 'Cache-Control': CACHE_CONTROL, 'Vary': VARY}
+
+
+def not_modified(etag: str):
+    return Response(status_code=304, headers=etag_headers(etag))
+
+
+def set_etag(response: Response, etag: str):
+    response.headers.update(etag_headers(etag))
+
+
+def bump_todo_seq(db: Session, owner_id: int):
+    """Advance the owner's todo change counter inside the current transaction."""
+    return db.execute(
+        update(Users)
+        .where(Users.id == owner_id)
+        .values(todo_seq=Users.todo_seq + 1)
+        .returning(Users.todo_seq)
+    ).scalar_one_or_none()
@@ -0,0 +1,289 @@
+"""
+Live todo events for GET /todos/stream.
+
+Writes in todos.py call publish_todo_event() after committing. The event goes
+to the configured broker, which delivers it to the EventHub of every worker.
+Each hub hands it to the streams that worker holds open for the todo's owner.
+
+* LocalBroker: in-process only, for a single worker and for tests.
+* PostgresBroker: NOTIFY on the `todo_events` channel, plus a LISTEN thread
+  per worker (the same pattern as invalidation.py).
+
+TODO_EVENTS_BROKER=auto (the default) picks Postgres when the database is
+Postgres and local otherwise.
+
+Account changes go out with owner None, so only hub listeners, such as the
+admin feed, receive them.
+
+Every event with a seq carries it as the SSE id. A browser that reconnects
+sends it back as Last-Event-ID, and the stream opens with what it missed
+(sync.missed_events) before going live.
+
+Events name what changed and the owner's todo seq, not the row. Clients pull
+the rows from /todos/changes. A subscriber that stops reading fills its
+bounded queue; the hub then drops what it holds and sends one `resync`
+event, so a slow client costs at most TODO_EVENTS_QUEUE_SIZE events of
+memory.
+"""
+import asyncio
+import json
+import logging
+import os
+import select
+import socket
+import threading
+import uuid
+
+from sqlalchemy import create_engine, func
+from sqlalchemy import select as sql_select
+from sqlalchemy.pool import NullPool
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'todo_events'
+BROKER = os.environ.get('TODO_EVENTS_BROKER', 'auto')
+QUEUE_SIZE = int(os.environ.get('TODO_EVENTS_QUEUE_SIZE', '100'))
+# Comment lines on idle streams keep proxies from closing them and let the
+# server notice clients that went away.
+HEARTBEAT_SECONDS = float(os.environ.get('TODO_EVENTS_HEARTBEAT_SECONDS', '15'))
+
+RESYNC = {'type': 'resync'}
+
+
+class Subscription:
+    def __init__(self, owner_id: int | None, maxsize: int = QUEUE_SIZE):
+        self.owner_id = owner_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.loop = asyncio.get_running_loop()
+        self.dropped = 0
+
+    def offer(self, event: dict):
+        """Queue event; on overflow replace the backlog with a single resync."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self, timeout: float):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class EventHub:
+    """This worker's open streams, by owner."""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """listener(owner_id, event) sees every event, for any owner (the admin feed)."""
+        # Copy on write: dispatch() iterates the list without the lock.
+        with self._lock:
+            self._listeners = [*self._listeners, listener]
+        return listener
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self._listeners = [other for other in self._listeners if other != listener]
+
+    def subscribe(self, owner_id: int):
+        subscription = Subscription(owner_id)
+        with self._lock:
+            self._subscriptions.setdefault(owner_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.owner_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.owner_id]
+
+    def dispatch(self, owner_id: int | None, event: dict):
+        """Deliver event to owner_id's streams; safe to call from any thread."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(owner_id, ()))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.offer, event)
+        for listener in self._listeners:
+            try:
+                listener(owner_id, event)
+            except Exception:
+                logger.exception('Todo event listener %r failed', listener)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._subscriptions),
+                'streams': sum(len(s) for s in self._subscriptions.values()),
+            }
+
+
+class LocalBroker:
+    """Delivers to this worker's hub only."""
+
+    def __init__(self, hub: EventHub):
+        self.hub = hub
+
+    def start(self, engine):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, owner_id: int, event: dict):
+        self.hub.dispatch(owner_id, event)
+
+
+class PostgresBroker(LocalBroker):
+    """Delivers locally at once and to the other workers through NOTIFY."""
+
+    def __init__(self, hub: EventHub):
+        super().__init__(hub)
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.engine = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, engine):
+        self.engine = engine
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name='todo-events', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def publish(self, owner_id: int, event: dict):
+        super().publish(owner_id, event)
+        payload = json.dumps({'origin': self.worker_id, 'owner_id': owner_id, 'event': event})
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(sql_select(func.pg_notify(CHANNEL, payload)))
+                conn.commit()
+        except Exception:
+            # Other workers' clients catch up on their next sync or reconnect.
+            logger.exception('Failed to publish todo event for owner %s', owner_id)
+
+    def _listen(self):
+        listen_engine = create_engine(self.engine.url, poolclass=NullPool)
+        backoff = 1.0
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = listen_engine.raw_connection()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                backoff = 1.0
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        message = json.loads(conn.notifies.pop(0).payload)
+                        if message['origin'] != self.worker_id:
+                            self.hub.dispatch(message['owner_id'], message['event'])
+            except Exception:
+                logger.exception('Todo event listener failed, reconnecting in %.0fs', backoff)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if raw is not None:
+                    raw.close()
+        listen_engine.dispose()
+
+
+class TodoEvents:
+    """The hub plus whichever broker the deployment is configured for."""
+
+    def __init__(self):
+        self.hub = EventHub()
+        self.broker = LocalBroker(self.hub)
+
+    def start(self, engine):
+        if BROKER == 'postgres' or (BROKER == 'auto' and engine.dialect.name == 'postgresql'):
+            self.broker = PostgresBroker(self.hub)
+        self.broker.start(engine)
+
+    def stop(self):
+        self.broker.stop()
+        self.broker = LocalBroker(self.hub)
+
+    def publish(self, owner_id: int, event: dict):
+        self.broker.publish(owner_id, event)
+
+
+todo_events = TodoEvents()
+
+
+def publish_todo_event(owner_id: int, op: str, todo_id: int, seq: int | None):
+    """Announce a committed change to owner_id's open streams, on every worker."""
+    todo_events.publish(owner_id, {'type': op, 'id': todo_id, 'seq': seq})
+
+
+def publish_user_event(op: str, user_id: int):
+    """Announce an account change; only hub listeners (the admin feed) see it."""
+    todo_events.publish(None, {'type': f'user_{op}', 'id': user_id, 'seq': None})
+
+
+def format_sse(event: dict):
+    data = json.dumps(event, separators=(',', ':'))
+    if event.get('seq') is not None:
+        return f"id: {event['seq']}\nevent: {event['type']}\ndata: {data}\n\n"
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+async def event_stream(owner_id: int, catch_up=None):
+    """
+    SSE body for owner_id: a retry hint, then events and heartbeats until the client leaves.
+
+    catch_up is a blocking callable returning the events a reconnecting
+    client missed. It runs after subscribing, so nothing published meanwhile
+    is lost, and its events go out with the retry hint in the first chunk.
+    Live events it already covered are skipped.
+    """
+    subscription = todo_events.hub.subscribe(owner_id)
+    try:
+        missed = await run_in_threadpool(catch_up) if catch_up is not None else []
+        caught_up = max((event['seq'] for event in missed if event.get('seq') is not None), default=0)
+        yield 'retry: 5000\n\n' + ''.join(format_sse(event) for event in missed)
+        while True:
+            try:
+                event = await subscription.get(HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            if event.get('seq') is not None and event['seq'] <= caught_up:
+                continue
+            yield format_sse(event)
+    finally:
+        todo_events.hub.unsubscribe(subscription)
+
+
+async def start_stream(stream):
+    """Run stream up to its first chunk now and return a body that replays it.
+
+    The endpoint's dependencies, such as the db session a catch_up uses, are
+    closed before a StreamingResponse starts iterating.
+    """
+    first = await stream.__anext__()
+
+    async def body():
+        try:
+            yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+    return body()
@@ -0,0 +1,194 @@
+"""
+Cross-worker cache invalidation.
+
+Each worker keeps its own in-process caches, so a write on one worker has to
+tell the others which keys went stale. publish() broadcasts key names:
+
+* Postgres: NOTIFY on the `cache_invalidation` channel, picked up by a
+  background thread holding a dedicated LISTEN connection.
+* SQLite: rows appended to a `cache_invalidations` table that a background
+  thread polls.
+
+publish() only queues the keys; a sender thread writes them, merging
+whatever queued up meanwhile into one message, so request handlers never
+wait on the database for it. Receivers hand the keys to every subscribed
+handler, on the listener thread. The key '*' means
+"drop everything" and is sent after a listener reconnects, because messages
+may have been missed while it was away.
+"""
+import json
+import logging
+import os
+import queue
+import select
+import socket
+import threading
+import time
+import uuid
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, create_engine, delete, func, insert
+from sqlalchemy import select as sql_select
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'cache_invalidation'
+INVALIDATION_MODE = os.environ.get('CACHE_INVALIDATION', 'auto')
+POLL_INTERVAL = float(os.environ.get('CACHE_INVALIDATION_POLL_SECONDS', '1'))
+# Polling rows older than this are pruned.
+RETENTION_SECONDS = 300
+
+_metadata = MetaData()
+cache_invalidations = Table(
+    'cache_invalidations', _metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('origin', String, nullable=False),
+    Column('keys', Text, nullable=False),
+    Column('created_at', Integer, nullable=False, index=True),
+)
+
+
+class InvalidationBus:
+    def __init__(self):
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.engine = None
+        self._handlers = []
+        self._thread = None
+        self._sender = None
+        self._outbox = queue.Queue()
+        self._stop = threading.Event()
+        self.received = 0
+
+    def subscribe(self, handler):
+        """handler(keys) is called with the key list of every remote invalidation."""
+        self._handlers.append(handler)
+        return handler
+
+    def start(self, engine):
+        if INVALIDATION_MODE == 'off' or self._thread is not None:
+            return
+        self.engine = engine
+        self._stop.clear()
+        if engine.dialect.name == 'postgresql':
+            target = self._listen_postgres
+            args = ()
+        else:
+            cache_invalidations.create(engine, checkfirst=True)
+            # Read the starting point here, not in the thread, so nothing
+            # published after start() returns can be skipped.
+            with engine.connect() as conn:
+                last_id = conn.execute(sql_select(func.max(cache_invalidations.c.id))).scalar() or 0
+            target = self._poll_table
+            args = (last_id,)
+        self._thread = threading.Thread(target=target, args=args, name='cache-invalidation', daemon=True)
+        self._thread.start()
+        self._sender = threading.Thread(target=self._send, name='cache-invalidation-send', daemon=True)
+        self._sender.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sender is not None:
+            self._outbox.put(None)
+            self._sender.join(timeout=5)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = self._sender = None
+        self.engine = None
+
+    def publish(self, *keys: str):
+        """Queue keys for the other workers to evict. Local eviction is the caller's job."""
+        if self._sender is not None and keys:
+            self._outbox.put(keys)
+
+    def _send(self):
+        while True:
+            batch = [self._outbox.get()]
+            while not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            keys = list(dict.fromkeys(key for item in batch if item is not None for key in item))
+            if keys:
+                self._write(keys)
+            if None in batch:
+                return
+
+    def _write(self, keys: list):
+        payload = json.dumps({'origin': self.worker_id, 'keys': keys})
+        try:
+            with self.engine.connect() as conn:
+                if self.engine.dialect.name == 'postgresql':
+                    conn.execute(sql_select(func.pg_notify(CHANNEL, payload)))
+                else:
+                    conn.execute(insert(cache_invalidations).values(
+                        origin=self.worker_id, keys=json.dumps(keys), created_at=int(time.time())
+                    ))
+                conn.commit()
+        except Exception:
+            # The write already committed; a missed invalidation only means
+            # other workers serve stale data until their TTL runs out.
+            logger.exception('Failed to publish cache invalidation for %s', keys)
+
+    def _dispatch(self, origin: str, keys: list):
+        if origin == self.worker_id:
+            return
+        self.received += 1
+        for handler in self._handlers:
+            try:
+                handler(keys)
+            except Exception:
+                logger.exception('Cache invalidation handler %r failed', handler)
+
+    def _listen_postgres(self):
+        # A pool-less engine so the LISTEN connection never occupies a pool slot.
+        listen_engine = create_engine(self.engine.url, poolclass=NullPool)
+        backoff = 1.0
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = listen_engine.raw_connection()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                self._dispatch('', ['*'])
+                backoff = 1.0
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        message = json.loads(conn.notifies.pop(0).payload)
+                        self._dispatch(message['origin'], message['keys'])
+            except Exception:
+                logger.exception('Cache invalidation listener failed, reconnecting in %.0fs', backoff)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if raw is not None:
+                    raw.close()
+        listen_engine.dispose()
+
+    def _poll_table(self, last_id: int):
+        last_prune = time.monotonic()
+        while not self._stop.wait(POLL_INTERVAL):
+            try:
+                with self.engine.connect() as conn:
+                    rows = conn.execute(
+                        sql_select(cache_invalidations)
+                        .where(cache_invalidations.c.id > last_id)
+                        .order_by(cache_invalidations.c.id)
+                    ).all()
+                    if time.monotonic() - last_prune > RETENTION_SECONDS:
+                        conn.execute(delete(cache_invalidations).where(
+                            cache_invalidations.c.created_at < int(time.time()) - RETENTION_SECONDS
+                        ))
+                        conn.commit()
+                        last_prune = time.monotonic()
+            except Exception:
+                logger.exception('Cache invalidation poll failed')
+                continue
+            for row in rows:
+                last_id = row.id
+                self._dispatch(row.origin, json.loads(row.keys))
+
+
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,168 @@
+"""
+Event-loop lag watchdog.
+
+A task on the event loop sleeps LOOP_LAG_INTERVAL_MS at a time. It records
+how late each wake-up is in a histogram. That is the scheduling delay every
+other coroutine saw at that moment. A watchdog thread checks the task's
+heartbeat. If the loop has not come back for LOOP_LAG_THRESHOLD_MS, the
+thread captures the loop thread's stack while it is still blocked, so the
+report names the blocking call: bcrypt, a sync query in an async handler,
+urllib in OAuth. It does not just note that something was slow.
+
+Each stall is logged once and kept with its stack (the last LOOP_LAG_KEEP of
+them). Stalls are also tallied by the innermost todoApp frame. GET
+/admin/loop shows all of this. /metrics exports the lag histogram and the
+stall count.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+from todoApp.metrics import LATENCY_BUCKETS, request_metrics
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL_MS = float(os.environ.get('LOOP_LAG_INTERVAL_MS', '100'))
+LOOP_LAG_THRESHOLD_MS = float(os.environ.get('LOOP_LAG_THRESHOLD_MS', '100'))
+LOOP_LAG_KEEP = int(os.environ.get('LOOP_LAG_KEEP', '50'))
+
+_APP_DIR = os.path.dirname(__file__)
+
+
+def _site(stack):
+    """The innermost frame in this app's code, else the innermost frame."""
+    for frame in reversed(stack):
+        if frame.filename.startswith(_APP_DIR) and frame.filename != __file__:
+            return f'{frame.name} ({os.path.relpath(frame.filename, _APP_DIR)}:{frame.lineno})'
+    frame = stack[-1]
+    return f'{frame.name} ({os.path.basename(frame.filename)}:{frame.lineno})'
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_MS / 1000,
+                 threshold: float = LOOP_LAG_THRESHOLD_MS / 1000, buckets=LATENCY_BUCKETS):
+        self.interval = interval
+        self.threshold = threshold
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.samples = 0
+        self.max_lag = 0.0
+        self.stalls = deque(maxlen=LOOP_LAG_KEEP)
+        self.sites = Counter()
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._loop_thread = None
+        self._current = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._task = self._thread = None
+
+    def observe(self, lag: float):
+        for index, bound in enumerate(self.buckets):
+            if lag <= bound:
+                self.counts[index] += 1
+                break
+        self.total += lag
+        self.samples += 1
+        self.max_lag = max(self.max_lag, lag)
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            self.observe(lag)
+            with self._lock:
+                stall, self._current = self._current, None
+            if stall is not None:
+                stall['lag_ms'] = round(lag * 1000, 1)
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            blocked = time.monotonic() - self._heartbeat - self.interval
+            if blocked < self.threshold or self._current is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            site = _site(stack)
+            stall = {
+                'at': datetime.now(timezone.utc).isoformat(),
+                'lag_ms': round(blocked * 1000, 1),
+                'site': site,
+                'stack': [f'{f.filename}:{f.lineno} in {f.name}' for f in stack[-25:]],
+            }
+            with self._lock:
+                if self._current is not None:
+                    continue
+                self._current = stall
+                self.stalls.append(stall)
+                self.sites[site] += 1
+            logger.warning('Event loop blocked for %.0fms+ in %s\n%s', blocked * 1000, site,
+                           ''.join(traceback.format_list(stack[-10:])))
+
+    def histogram(self):
+        """Cumulative {le_ms: count} pairs, Prometheus style."""
+        cumulative, result = 0, {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            result[str(bound * 1000)] = cumulative
+        result['+Inf'] = self.samples
+        return result
+
+    def report(self):
+        with self._lock:
+            stalls = list(self.stalls)[::-1]
+            sites = self.sites.most_common(10)
+        return {
+            'interval_ms': self.interval * 1000,
+            'threshold_ms': self.threshold * 1000,
+            'samples': self.samples,
+            'mean_lag_ms': round(self.total / self.samples * 1000, 2) if self.samples else 0.0,
+            'max_lag_ms': round(self.max_lag * 1000, 1),
+            'histogram_ms': self.histogram(),
+            'top_sites': [{'site': site, 'stalls': count} for site, count in sites],
+            'stalls': stalls,
+        }
+
+    def metrics(self):
+        with self._lock:
+            stalls = sum(self.sites.values())
+        return {
+            'counters': {'todoapp_event_loop_stalls_total': [[{}, stalls]]},
+            'histograms': {'todoapp_event_loop_lag_seconds': [[{}, list(self.counts), self.total, self.samples]]},
+        }
+
+
+loop_watchdog = LoopWatchdog()
+request_metrics.add_source(loop_watchdog.metrics)
@@ -1,26 +1,81 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
 from todoApp.models import Base
 from todoApp.database import engine
 from todoApp.routers import auth, todos, admin, users
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
-from fastapi.templating import Jinja2Templates
+from todoApp.search import ensure_search_index
+from todoApp.invalidation import invalidation_bus
+from todoApp.events import todo_events
+from todoApp.negotiation import ContentNegotiationMiddleware, NegotiatedResponse
+from todoApp.compression import CompressionMiddleware
+from todoApp.assets import PrecompressedStaticFiles
+from todoApp.templating import precompile_templates, render_page
+from todoApp.timing import ServerTimingMiddleware
+from todoApp.querylog import QueryLogMiddleware
+from todoApp.profiling import ProfilingMiddleware
+from todoApp.loopwatch import loop_watchdog
+from todoApp.tracing import TracingMiddleware, tracer
+from todoApp.metrics import CONTENT_TYPE, MetricsMiddleware, exporter, pool_stats, request_metrics
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.concurrency import run_in_threadpool
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    precompile_templates()
+    invalidation_bus.start(engine)
+    todo_events.start(engine)
+    admin.admin_feed.start()
+    exporter.start()
+    loop_watchdog.start()
+    yield
+    await loop_watchdog.stop()
+    tracer.shutdown()
+    await exporter.stop()
+    await admin.admin_feed.stop()
+    todo_events.stop()
+    invalidation_bus.stop()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=NegotiatedResponse)
+app.add_middleware(ContentNegotiationMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(QueryLogMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+request_metrics.add_source(lambda: pool_stats(engine))
 
 Base.metadata.create_all(bind=engine)
+ensure_search_index(engine)
+
+app.mount("/static", PrecompressedStaticFiles(directory="todoApp/static"), name="static")
+
+@app.exception_handler(StarletteHTTPException)
+async def redirect_pages_to_login(request: Request, exc: StarletteHTTPException):
+    """Pages (routes declared with response_class=HTMLResponse) send signed-out visitors to the login page."""
+    route = request.scope.get('route')
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED and getattr(route, 'response_class', None) is HTMLResponse:
+        return RedirectResponse(url='/auth/login-page', status_code=status.HTTP_302_FOUND)
+    return await http_exception_handler(request, exc)
 
-templates = Jinja2Templates(directory='todoApp/templates')
-app.mount("/static", StaticFiles(directory="todoApp/static"), name="static")
 
 @app.get("/")
 def test(request:Request):
-    return templates.TemplateResponse("home.html" , {"request" : request})
+    return render_page(request, "home.html")
 
 @app.get("/healthy")
 def health_check():
     return {'status': 'Healthy'}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    own = request_metrics.snapshot()
+    return Response(await run_in_threadpool(exporter.collect, own), media_type=CONTENT_TYPE)
+
 
 app.include_router(auth.router)
 app.include_router(todos.router)
@@ -0,0 +1,307 @@
+"""
+Request, database pool and cache metrics in the Prometheus text format.
+
+MetricsMiddleware records, per worker, a latency histogram and a status
+counter for each route template (`/todos/todo/{todo_id}`, not the raw path),
+plus the number of requests in flight. Recording happens only on the event
+loop thread, so the aggregates are plain dicts with no locks on the request
+path. Pool and cache figures are read when a snapshot is taken.
+
+With one worker, GET /metrics renders this worker's snapshot. With several
+uvicorn workers, set METRICS_DIR to a directory they share. Each worker then
+writes its snapshot to METRICS_DIR/<pid>.json every METRICS_FLUSH_SECONDS
+(write to a temp file, then rename), and /metrics merges every file. Counters
+and histograms of exited workers keep counting, as Prometheus expects.
+Gauges are only taken from files refreshed within the last few flushes.
+"""
+import asyncio
+import bisect
+import glob
+import json
+import os
+import time
+
+from todoApp.cache import admin_cache, todo_cache
+from todoApp.templating import page_cache
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', '5'))
+# Upper bounds in seconds; the implicit +Inf bucket is the request count.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Cache stats() fields exported as counters; `size` is exported as a gauge.
+_CACHE_COUNTERS = ('hits', 'misses', 'stale_hits', 'evictions', 'expirations', 'computations')
+
+_HELP = {
+    'todoapp_http_requests_total': ('counter', 'HTTP requests by route template and status.'),
+    'todoapp_http_request_duration_seconds': ('histogram', 'HTTP request latency by route template.'),
+    'todoapp_http_requests_in_progress': ('gauge', 'HTTP requests currently being served.'),
+    'todoapp_db_pool_connections': ('gauge', 'Database pool connections by state.'),
+    'todoapp_cache_entries': ('gauge', 'Entries held by each cache.'),
+    'todoapp_event_loop_lag_seconds': ('histogram', 'How late the event loop woke a sleeping task.'),
+    'todoapp_event_loop_stalls_total': ('counter', 'Event loop stalls over LOOP_LAG_THRESHOLD_MS.'),
+    **{f'todoapp_cache_{field}_total': ('counter', f'Cache {field.replace("_", " ")}.') for field in _CACHE_COUNTERS},
+}
+
+
+def route_label(scope):
+    """The matched route's path template; mounted apps report their prefix."""
+    route = scope.get('route')
+    if route is not None:
+        return route.path
+    if scope.get('root_path'):
+        return scope['root_path'] + '/*'
+    return 'unmatched'
+
+
+class Metrics:
+    """One worker's request aggregates. Only the event loop thread writes them."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.requests = {}
+        self.latency = {}
+        self.in_progress = {}
+        self.sources = []
+
+    def add_source(self, source):
+        """source() returns extra {'counters': ..., 'gauges': ..., 'histograms': ...} series, read at snapshot time.
+
+        Source histograms must use this registry's buckets.
+        """
+        self.sources.append(source)
+        return source
+
+    def observe(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route, str(status))
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, seconds)
+        if index < len(self.buckets):
+            histogram[0][index] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+    def snapshot(self):
+        """A JSON-safe copy of every series; see merge() for the layout."""
+        counters = {'todoapp_http_requests_total': [
+            [{'method': m, 'route': r, 'status': s}, value] for (m, r, s), value in self.requests.items()
+        ]}
+        gauges = {'todoapp_http_requests_in_progress': [
+            [{'method': m}, value] for m, value in self.in_progress.items()
+        ]}
+        histograms = {'todoapp_http_request_duration_seconds': [
+            [{'method': m, 'route': r}, list(counts), total, count]
+            for (m, r), (counts, total, count) in self.latency.items()
+        ]}
+        for source in self.sources:
+            extra = source()
+            for name, series in extra.get('counters', {}).items():
+                counters.setdefault(name, []).extend(series)
+            for name, series in extra.get('gauges', {}).items():
+                gauges.setdefault(name, []).extend(series)
+            for name, series in extra.get('histograms', {}).items():
+                histograms.setdefault(name, []).extend(series)
+        return {
+            'pid': os.getpid(),
+            'written': time.time(),
+            'buckets': list(self.buckets),
+            'counters': counters,
+            'gauges': gauges,
+            'histograms': histograms,
+        }
+
+
+def _key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+
+def merge(snapshots, now: float | None = None, max_age: float | None = None):
+    """Sum snapshots series by series; gauges only from snapshots newer than max_age."""
+    now = time.time() if now is None else now
+    counters, gauges, histograms = {}, {}, {}
+    buckets = list(LATENCY_BUCKETS)
+    for snapshot in snapshots:
+        buckets = snapshot['buckets']
+        for name, series in snapshot['counters'].items():
+            merged = counters.setdefault(name, {})
+            for labels, value in series:
+                merged[_key(labels)] = merged.get(_key(labels), 0) + value
+        if max_age is None or now - snapshot['written'] <= max_age:
+            for name, series in snapshot['gauges'].items():
+                merged = gauges.setdefault(name, {})
+                for labels, value in series:
+                    merged[_key(labels)] = merged.get(_key(labels), 0) + value
+        for name, series in snapshot['histograms'].items():
+            merged = histograms.setdefault(name, {})
+            for labels, counts, total, count in series:
+                entry = merged.setdefault(_key(labels), [[0] * len(counts), 0.0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+    return {'buckets': buckets, 'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(key, extra=()):
+    pairs = [*key, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(merged):
+    """Prometheus text exposition (format 0.0.4) of a merge() result."""
+    lines = []
+
+    def header(name):
+        kind, text = _HELP.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    for kind in ('counters', 'gauges'):
+        for name, series in sorted(merged[kind].items()):
+            header(name)
+            for key, value in sorted(series.items()):
+                lines.append(f'{name}{_labels(key)} {_number(value)}')
+    bounds = [*merged['buckets'], float('inf')]
+    for name, series in sorted(merged['histograms'].items()):
+        header(name)
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket in zip(bounds, [*counts, count - sum(counts)]):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{_labels(key, [("le", _number(float(bound)))])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(key)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(key)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """Writes this worker's snapshot to METRICS_DIR and merges every worker's on scrape."""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self.directory = None
+        self._task = None
+
+    def start(self, directory: str | None = METRICS_DIR):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self.flush()
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self.flush()
+            await asyncio.sleep(METRICS_FLUSH_SECONDS)
+
+    def flush(self):
+        return self.write(self.metrics.snapshot())
+
+    def write(self, snapshot):
+        path = os.path.join(self.directory, f'{snapshot["pid"]}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+        return snapshot
+
+    def collect(self, own):
+        """Text for GET /metrics: own (this worker's snapshot), plus every worker's when METRICS_DIR is set.
+
+        Take own on the event loop, the only thread that may read the
+        aggregates; this method can then run in the threadpool.
+        """
+        if not self.directory:
+            return render(merge([own]))
+        self.write(own)
+        snapshots = [own]
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            if os.path.basename(path) == f'{own["pid"]}.json':
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return render(merge(snapshots, max_age=3 * METRICS_FLUSH_SECONDS))
+
+
+class MetricsMiddleware:
+    def __init__(self, app, metrics: Metrics | None = None):
+        self.app = app
+        self.metrics = metrics or request_metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        metrics = self.metrics
+        method = scope['method']
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        metrics.in_progress[method] = metrics.in_progress.get(method, 0) + 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_progress[method] -= 1
+            metrics.observe(method, route_label(scope), status, time.perf_counter() - started)
+
+
+def pool_stats(engine):
+    """Connection counts for pools that track them (QueuePool and friends)."""
+    pool = engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return {}
+    return {'gauges': {'todoapp_db_pool_connections': [
+        [{'state': 'checked_out'}, pool.checkedout()],
+        [{'state': 'checked_in'}, pool.checkedin()],
+        [{'state': 'overflow'}, max(pool.overflow(), 0)],
+        [{'state': 'size'}, pool.size()],
+    ]}}
+
+
+def cache_stats(caches: dict):
+    counters, entries = {}, []
+    for name, cache in caches.items():
+        stats = cache.stats()
+        entries.append([{'cache': name}, stats['size']])
+        for field in _CACHE_COUNTERS:
+            if field in stats:
+                counters.setdefault(f'todoapp_cache_{field}_total', []).append([{'cache': name}, stats[field]])
+    return {'counters': counters, 'gauges': {'todoapp_cache_entries': entries}}
+
+
+request_metrics = Metrics()
+request_metrics.add_source(lambda: cache_stats({'todos': todo_cache, 'admin': admin_cache, 'pages': page_cache}))
+exporter = MetricsExporter(request_metrics)
@@ -1,5 +1,5 @@
 from todoApp.database import Base
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 
 
 class Users(Base):
@@ -16,6 +16,10 @@ class Users(Base):
     role = Column(String)
     address = Column(String)
     phone_number = Column(String)
+    # Bumped on every profile change; the profile ETag.
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    # Bumped on every change to this user's todos; the todo list ETag.
+    todo_seq = Column(Integer, nullable=False, default=0, server_default='0')
 
 class Todos(Base):
     __tablename__ = 'todos'
@@ -25,4 +29,29 @@ class Todos(Base):
     description = Column(String)
     priority = Column(Integer)
     complete = Column(Boolean, default=False)
-    owner_id = Column(Integer,  ForeignKey ('users.id'))
\ No newline at end of file
+    owner_id = Column(Integer,  ForeignKey ('users.id'))
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    # The owner's todo_seq as of this row's last change, and when it happened;
+    # GET /todos/changes returns rows with seq above the client's.
+    seq = Column(Integer, nullable=False, default=0, server_default='0')
+    updated_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (Index('ix_todos_owner_seq', 'owner_id', 'seq'),)
+
+    # On Postgres the table is hash partitioned by owner_id (see the
+    # 3c1f0a9e2b7d migration), so the ORM keys rows on (id, owner_id) to keep
+    # its own UPDATE/DELETE statements prunable to a single partition.
+    __mapper_args__ = {'primary_key': [id, owner_id]}
+
+
+class TodoTombstones(Base):
+    """A deleted todo, kept so delta sync can tell clients to drop it."""
+    __tablename__ = 'todo_tombstones'
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, nullable=False)
+    todo_id = Column(Integer, nullable=False)
+    seq = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (Index('ix_todo_tombstones_owner_seq', 'owner_id', 'seq'),)
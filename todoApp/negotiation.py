@@ -0,0 +1,135 @@
+"""
+Accept-driven response encodings.
+
+JSON stays the default. Clients that send `Accept: application/msgpack` (or
+`application/cbor`, when the optional cbor2 package is installed) get the
+same payload in that binary encoding instead.
+
+ContentNegotiationMiddleware records the preferred encoding for the request
+in a context variable. NegotiatedResponse, the app's default response class,
+renders with it. make_etag() in etag.py folds it into ETags so each
+representation keeps its own strong validator.
+"""
+from contextvars import ContextVar
+from datetime import date, datetime, timezone
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+from todoApp.timing import phase
+from todoApp.tracing import span
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is in requirements.txt
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+CBOR = 'cbor'
+
+MEDIA_TYPES = {
+    JSON: 'application/json',
+    MSGPACK: 'application/msgpack',
+    CBOR: 'application/cbor',
+}
+
+_ACCEPTED = {
+    'application/json': JSON,
+    'application/*': JSON,
+    '*/*': JSON,
+    'application/msgpack': MSGPACK,
+    'application/x-msgpack': MSGPACK,
+    'application/vnd.msgpack': MSGPACK,
+    'application/cbor': CBOR,
+}
+
+_encoding: ContextVar[str] = ContextVar('response_encoding', default=JSON)
+
+
+def _available(encoding: str):
+    if encoding == MSGPACK:
+        return msgpack is not None
+    if encoding == CBOR:
+        return cbor2 is not None
+    return True
+
+
+def parse_accept(accept: str | None):
+    """Best encoding we can produce for an Accept header; ties go to the earliest listed."""
+    if not accept:
+        return JSON
+    best, best_q = None, 0.0
+    for item in accept.split(','):
+        media_type, _, params = item.strip().partition(';')
+        encoding = _ACCEPTED.get(media_type.strip().lower())
+        if encoding is None or not _available(encoding):
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = encoding, q
+    return best or JSON
+
+
+def preferred_encoding():
+    return _encoding.get()
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Cannot encode {type(value).__name__}')
+
+
+class NegotiatedResponse(ORJSONResponse):
+    """orjson by default, MessagePack or CBOR when the request asked for it."""
+
+    def __init__(self, content=None, *args, **kwargs):
+        self.encoding = preferred_encoding()
+        if self.encoding != JSON:
+            self.media_type = MEDIA_TYPES[self.encoding]
+        super().__init__(content, *args, **kwargs)
+        self.headers.setdefault('vary', 'Accept')
+
+    def render(self, content) -> bytes:
+        with phase('encode'), span('encode', encoding=self.encoding):
+            return self._render(content)
+
+    def _render(self, content) -> bytes:
+        if self.encoding == MSGPACK:
+            return msgpack.packb(content, use_bin_type=True, default=_default)
+        if self.encoding == CBOR:
+            return cbor2.dumps(content, timezone=timezone.utc)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS, default=_default)
+
+
+class ContentNegotiationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        accept = None
+        for name, value in scope['headers']:
+            if name == b'accept':
+                accept = value.decode('latin-1')
+                break
+        token = _encoding.set(parse_accept(accept))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _encoding.reset(token)
@@ -0,0 +1,206 @@
+"""
+On-demand sampling profiles of single requests, for admins.
+
+A request asks for a profile with an `X-Profile: 1` header or a `profile=1`
+query parameter. ProfilingMiddleware only notes the ask. The profile starts
+once get_current_user has confirmed that the caller is an admin; for
+everyone else the flag does nothing. It stops when the response headers go
+out.
+
+While it runs, a sampler thread records the stack of every busy thread every
+PROFILE_INTERVAL_MS. The stacks are written in the folded format ("a;b;c
+count" per line), which flamegraph.pl, speedscope and inferno read directly.
+Files go to PROFILE_DIR, which keeps the newest PROFILE_KEEP. The response's
+X-Profile header names the file, and /admin/profiles serves it.
+
+This is a process-wide sampler, like py-spy, so requests served concurrently
+appear in the profile too. That is why each worker runs at most one profile
+at a time and at most PROFILE_MAX_PER_HOUR an hour. A request that is refused
+gets `X-Profile: rate-limited`. Set PROFILING=0 to ignore the flag entirely.
+"""
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, QueryParams
+
+from todoApp.metrics import route_label
+
+PROFILING = os.environ.get('PROFILING', '1') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'todoapp-profiles'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', '30'))
+PROFILE_MAX_PER_HOUR = int(os.environ.get('PROFILE_MAX_PER_HOUR', '10'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '20'))
+
+PROFILE_NAME = re.compile(r'^[\w.-]+\.folded$')
+# A thread whose innermost frame is in one of these is waiting, not working.
+_IDLE_FILES = ('threading.py', 'queue.py', 'selectors.py')
+
+
+def _frame_label(code):
+    path = code.co_filename.replace('\\', '/').rsplit('/', 2)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """Folded stacks of every busy thread, sampled on a background thread."""
+
+    def __init__(self, interval: float, max_seconds: float):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own or frame.f_code.co_filename.endswith(_IDLE_FILES):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                labels.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(labels))] += 1
+
+
+class Profiler:
+    """This worker's rate limit and the profile files it has written."""
+
+    def __init__(self, directory: str = PROFILE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._running = False
+        self._started = deque()
+
+    def acquire(self):
+        """Whether a profile may start now; counts against the hourly limit if so."""
+        now = time.monotonic()
+        with self._lock:
+            while self._started and now - self._started[0] > 3600:
+                self._started.popleft()
+            if self._running or len(self._started) >= PROFILE_MAX_PER_HOUR:
+                return False
+            self._running = True
+            self._started.append(now)
+            return True
+
+    def release(self):
+        with self._lock:
+            self._running = False
+
+    def finish(self, sampler: Sampler, method: str, route: str):
+        """Stop sampler, save its stacks and free the slot; blocks, so run it off the event loop."""
+        try:
+            return self.save(sampler.stop(), method, route)
+        finally:
+            self.release()
+
+    def save(self, stacks: Counter, method: str, route: str):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+        slug = re.sub(r'[^\w]+', '_', route).strip('_') or 'root'
+        name = f'{stamp}-{method.lower()}-{slug}-{os.getpid()}.folded'
+        with open(os.path.join(self.directory, name), 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        for old in self.list()[PROFILE_KEEP:]:
+            os.remove(os.path.join(self.directory, old))
+        return name
+
+    def list(self):
+        """Saved profile names, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name for name in os.listdir(self.directory) if PROFILE_NAME.match(name)), reverse=True)
+
+    def path(self, name: str):
+        """Full path of a saved profile, or None for unknown names."""
+        if not PROFILE_NAME.match(name) or name not in self.list():
+            return None
+        return os.path.join(self.directory, name)
+
+
+profiler = Profiler()
+
+
+class ProfileRequest:
+    def __init__(self):
+        self.sampler = None
+        self.outcome = None
+
+
+_requested: ContextVar[ProfileRequest | None] = ContextVar('profile_request', default=None)
+
+
+def start_profile(user: dict):
+    """Called by get_current_user: begin the profile this request asked for, if user is an admin."""
+    request = _requested.get()
+    if request is None or request.outcome is not None or user.get('user_role') != 'admin':
+        return
+    if not profiler.acquire():
+        request.outcome = 'rate-limited'
+        return
+    request.outcome = 'running'
+    request.sampler = Sampler(PROFILE_INTERVAL_MS / 1000, PROFILE_MAX_SECONDS).start()
+
+
+def _wants_profile(scope):
+    if Headers(scope=scope).get('x-profile') == '1':
+        return True
+    return b'profile=' in scope['query_string'] and QueryParams(scope['query_string']).get('profile') == '1'
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not PROFILING or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        request = ProfileRequest()
+        token = _requested.set(request)
+
+        async def finish():
+            sampler, request.sampler = request.sampler, None
+            if sampler is not None:
+                request.outcome = await run_in_threadpool(profiler.finish, sampler, scope['method'], route_label(scope))
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                await finish()
+                if request.outcome is not None:
+                    message['headers'] = [*message.get('headers', []), (b'x-profile', request.outcome.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _requested.reset(token)
+            await finish()
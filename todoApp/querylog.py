@@ -0,0 +1,121 @@
+"""
+Per-request SQL accounting: slow-query log, query budget and N+1 warnings.
+
+QueryLogMiddleware gives each request a RequestQueries record in a context
+variable. The shared cursor hook (dbhooks.py) adds every statement's time
+to it:
+
+* A statement slower than SLOW_QUERY_MS is logged at WARNING, with the
+  request's route and its normalized SQL (placeholders, not values).
+* A request that runs more than QUERY_BUDGET statements is logged with its
+  query count and total DB time.
+* A request that runs the same normalized statement N_PLUS_ONE_THRESHOLD
+  times or more is logged as a likely N+1.
+
+Tests use capture_queries() (see assert_max_queries in test/utils.py). It
+sees statements from any thread, including the TestClient's portal thread.
+Statements outside both a request and a capture block are not watched.
+"""
+import logging
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from todoApp.dbhooks import on_statement
+from todoApp.metrics import route_label
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', '30'))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', '5'))
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\?|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(statement: str):
+    """statement with literals and bound parameters as ?, IN lists collapsed and whitespace squeezed."""
+    statement = _PLACEHOLDER.sub('?', _SPACE.sub(' ', statement).strip())
+    return _LIST.sub('(?, ...)', statement)
+
+
+class RequestQueries:
+    def __init__(self, scope):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    @property
+    def route(self):
+        return f"{self.scope['method']} {route_label(self.scope)}"
+
+    def report(self):
+        if self.count > QUERY_BUDGET:
+            logger.warning('%s ran %d queries (%.1fms of DB time), over the budget of %d',
+                           self.route, self.count, self.seconds * 1000, QUERY_BUDGET)
+        for statement, count in self.statements.items():
+            if count >= N_PLUS_ONE_THRESHOLD:
+                logger.warning('Possible N+1 on %s: %d x %s', self.route, count, statement)
+
+
+_queries: ContextVar[RequestQueries | None] = ContextVar('request_queries', default=None)
+_collectors = []
+
+
+def current_queries():
+    return _queries.get()
+
+
+@contextmanager
+def capture_queries():
+    """Collect the normalized SQL of every statement run, on any thread, while the block runs."""
+    statements = []
+    _collectors.append(statements)
+    try:
+        yield statements
+    finally:
+        _collectors.remove(statements)
+
+
+@on_statement
+def _watch_statement(conn, statement):
+    queries = _queries.get()
+    if queries is None and not _collectors:
+        return None
+
+    def finished(statement, seconds, error):
+        if error is not None:
+            return
+        normalized = normalize_sql(statement)
+        for statements in _collectors:
+            statements.append(normalized)
+        if queries is not None:
+            queries.count += 1
+            queries.seconds += seconds
+            queries.statements[normalized] += 1
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            logger.warning('Slow query (%.1fms) on %s: %s', seconds * 1000,
+                           queries.route if queries is not None else 'background', normalized)
+    return finished
+
+
+class QueryLogMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        queries = RequestQueries(scope)
+        token = _queries.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _queries.reset(token)
+            queries.report()
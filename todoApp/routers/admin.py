@@ -1,12 +1,27 @@
-from typing import Annotated
+from typing import Annotated, Literal
 from pydantic import BaseModel, Field
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends, HTTPException, Path, Request
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 from starlette import status
+from starlette.concurrency import run_in_threadpool
 from todoApp.models import Todos, Users
+from todoApp.negotiation import NegotiatedResponse
+from todoApp.schemas import (AdminOverviewResponse, AdminUserRow, StatsResponse, TodoResponse, UserResponse,
+                             columns_for, rows_as_dicts)
 from todoApp.database import SessionLocal
+from todoApp.timing import checkout
 from todoApp.routers.auth import get_current_user
-from fastapi.templating import Jinja2Templates
+from todoApp.cache import admin_cache, invalidate_todos, todo_cache
+from todoApp.etag import bump_todo_seq
+from todoApp.sync import record_delete
+from todoApp.events import publish_todo_event
+from todoApp.admin_feed import AdminFeed
+from todoApp.templating import render_page
+from todoApp.profiling import profiler
+from todoApp.loopwatch import loop_watchdog
+from todoApp.tracing import span
 
 router = APIRouter(
     prefix='/admin',
@@ -17,6 +32,7 @@ router = APIRouter(
 def get_db():
     db = SessionLocal()
     try:
+        checkout(db)
         yield db
     finally:
         db.close()
@@ -25,21 +41,60 @@ def get_db():
 db_dependency = Annotated[Session, Depends(get_db)]
 user_dependency = Annotated[dict, Depends(get_current_user)]
 
-templates = Jinja2Templates(directory="todoApp/templates")
 
-
-@router.get("/dashboard")
+@router.get("/dashboard", response_class=HTMLResponse)
 def render_admin_dashboard(user: user_dependency, request: Request):
     if user is None or user.get('user_role') != 'admin':
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    return templates.TemplateResponse("admin_dashboard.html", {"request": request})
+    return render_page(request, "admin_dashboard.html")
+
+
+def _all_todos(db: Session):
+    rows = db.execute(select(*columns_for(Todos, TodoResponse))).all()
+    return rows_as_dicts(rows, TodoResponse)
+
+
+def _all_users(db: Session):
+    rows = db.execute(select(*columns_for(Users, UserResponse))).all()
+    return rows_as_dicts(rows, UserResponse)
+
+
+def _stats(db: Session):
+    total_users = db.query(func.count(Users.id)).scalar()
+    total_todos, completed_todos = db.query(
+        func.count(Todos.id),
+        func.count(Todos.id).filter(Todos.complete == True)
+    ).one()
+    return {
+        "total_users": total_users,
+        "total_todos": total_todos,
+        "completed_todos": completed_todos,
+        "pending_todos": total_todos - completed_todos
+    }
+
+
+admin_feed = AdminFeed(lambda: admin_cache.run(_stats))
 
 
-@router.get("/todo", status_code=status.HTTP_200_OK)
-async def read_all(user: user_dependency, db: db_dependency):
+@router.get("/stream")
+async def stream(user: user_dependency):
+    """Server-Sent Events: a stats snapshot, then coalesced stat deltas and recent changes."""
     if user is None or user.get('user_role') != 'admin':
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    return db.query(Todos).all()
+    if not admin_feed.running:
+        raise HTTPException(status_code=503, detail='Live feed is not running.')
+    return StreamingResponse(
+        admin_feed.stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@router.get("/todo", status_code=status.HTTP_200_OK, response_model=list[TodoResponse])
+async def read_all(user: user_dependency):
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    return NegotiatedResponse(await admin_cache.get('todos', _all_todos))
 
 @router.delete("/todo/{todo_id}" , status_code=status.HTTP_204_NO_CONTENT)
 async def delete_todo(user: user_dependency, db: db_dependency, todo_id:int = Path(gt=0)):
@@ -48,28 +103,122 @@ async def delete_todo(user: user_dependency, db: db_dependency, todo_id:int = Pa
     todo_model = db.query(Todos).filter(Todos.id == todo_id).first()
     if todo_model is None:
          raise HTTPException(status_code=404, detail='Todo not found.')
+    owner_id = todo_model.owner_id
     db.delete(todo_model)
+    seq = bump_todo_seq(db, owner_id)
+    record_delete(db, owner_id, todo_id, seq)
     db.commit()
+    invalidate_todos(owner_id, todo_id)
+    publish_todo_event(owner_id, 'deleted', todo_id, seq)
 
 
-@router.get("/users", status_code=status.HTTP_200_OK)
-async def list_users(user: user_dependency, db: db_dependency):
+@router.get("/users", status_code=status.HTTP_200_OK, response_model=list[UserResponse])
+async def list_users(user: user_dependency):
     if user is None or user.get('user_role') != 'admin':
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    return db.query(Users).all()
+    return NegotiatedResponse(await admin_cache.get('users', _all_users))
 
 
-@router.get("/stats", status_code=status.HTTP_200_OK)
-async def admin_stats(user: user_dependency, db: db_dependency):
+@router.get("/stats", status_code=status.HTTP_200_OK, response_model=StatsResponse)
+async def admin_stats(user: user_dependency):
     if user is None or user.get('user_role') != 'admin':
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    total_users = db.query(Users).count()
-    total_todos = db.query(Todos).count()
-    completed_todos = db.query(Todos).filter(Todos.complete == True).count()
-    pending_todos = total_todos - completed_todos
-    return {
-        "total_users": total_users,
-        "total_todos": total_todos,
-        "completed_todos": completed_todos,
-        "pending_todos": pending_todos
-    }
\ No newline at end of file
+    return await admin_cache.get('stats', _stats)
+
+
+# Sort keys are limited to indexed columns so every page is an index scan.
+OVERVIEW_SORTS = {'id': Users.id, 'username': Users.username, 'email': Users.email}
+
+
+def _prefix_filter(q: str):
+    """Case-insensitive prefix match on username or email (lower(col) text_pattern_ops indexes on Postgres)."""
+    pattern = q.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return (func.lower(Users.username).like(pattern, escape='\\')
+            | func.lower(Users.email).like(pattern, escape='\\'))
+
+
+def _ordered(columns, sort: str, order: str):
+    """ORDER BY sort, then id so pages are stable when sort has ties."""
+    column = columns[sort]
+    ordered = [column.desc() if order == 'desc' else column.asc()]
+    return ordered if sort == 'id' else [*ordered, columns['id']]
+
+
+def user_overview(db: Session, q: str | None, sort: str, order: str, limit: int, offset: int):
+    """One page of users with their todo and completed counts, and the number of matching users."""
+    page = select(Users.id, Users.username, Users.email, Users.role, Users.is_active)
+    total = select(func.count(Users.id))
+    if q:
+        page = page.where(_prefix_filter(q))
+        total = total.where(_prefix_filter(q))
+    # Page the users first, then aggregate only their todos.
+    page = page.order_by(*_ordered(OVERVIEW_SORTS, sort, order)).limit(limit).offset(offset).subquery()
+
+    rows = db.execute(
+        select(
+            *page.c,
+            func.count(Todos.id),
+            func.count(Todos.id).filter(Todos.complete == True),
+        )
+        .outerjoin(Todos, Todos.owner_id == page.c.id)
+        .group_by(*page.c)
+        .order_by(*_ordered(page.c, sort, order))
+    ).all()
+    return rows_as_dicts(rows, AdminUserRow), db.execute(total).scalar()
+
+
+@router.get("/overview", status_code=status.HTTP_200_OK, response_model=AdminOverviewResponse)
+async def overview(
+    user: user_dependency,
+    db: db_dependency,
+    q: str | None = Query(default=None, min_length=1, max_length=100),
+    sort: Literal['id', 'username', 'email'] = 'id',
+    order: Literal['asc', 'desc'] = 'asc',
+    limit: int = Query(default=25, gt=0, le=100),
+    offset: int = Query(default=0, ge=0),
+):
+    """Dashboard stats plus one page of users with per-user todo counts."""
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    with span('admin.user_overview', sort=sort, order=order, offset=offset):
+        users, total = await run_in_threadpool(user_overview, db, q, sort, order, limit, offset)
+    return NegotiatedResponse({
+        'stats': await admin_cache.get('stats', _stats),
+        'users': users,
+        'total': total,
+        'limit': limit,
+        'offset': offset,
+    })
+
+
+@router.get("/cache", status_code=status.HTTP_200_OK)
+async def cache_stats(user: user_dependency):
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    return {'todos': todo_cache.stats(), 'admin': admin_cache.stats()}
+
+
+@router.get("/loop", status_code=status.HTTP_200_OK)
+async def event_loop_lag(user: user_dependency):
+    """This worker's event-loop lag histogram and the stacks of recent stalls."""
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    return loop_watchdog.report()
+
+
+@router.get("/profiles", status_code=status.HTTP_200_OK)
+async def list_profiles(user: user_dependency):
+    """Profiles saved by this worker's X-Profile requests, newest first."""
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    return profiler.list()
+
+
+@router.get("/profiles/{name}", status_code=status.HTTP_200_OK)
+async def read_profile(user: user_dependency, name: str):
+    if user is None or user.get('user_role') != 'admin':
+        raise HTTPException(status_code=401, detail='Authentication Failed')
+    path = profiler.path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail='Profile not found.')
+    return FileResponse(path, media_type='text/plain; charset=utf-8', filename=name)
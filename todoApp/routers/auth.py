@@ -4,16 +4,22 @@ Provides endpoints for user registration, login, and Google OAuth integration.
 """
 from datetime import timedelta, datetime, timezone
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from starlette import status
 from todoApp.database import get_db
 from todoApp.models import Users
+from todoApp.templating import render_page
+from todoApp.csrf import set_csrf_cookie, verify_csrf
+from todoApp.cache import invalidate_user
+from todoApp.events import publish_user_event
+from todoApp.timing import phase
+from todoApp.tracing import span
+from todoApp.profiling import start_profile
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from jose import jwt, JWTError
-from fastapi.templating import Jinja2Templates
 from fastapi.responses import RedirectResponse
 import os
 import json
@@ -30,7 +36,8 @@ SECRET_KEY = '197b2c37c391bed93fe80344fe73b806947a65e36206e05a1a23c2fa12702fe3'
 ALGORITHM = 'HS256'
 
 bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
-oauth2_bearer = OAuth2PasswordBearer(tokenUrl='auth/token')
+# auto_error=False: a missing header falls back to the access_token cookie.
+oauth2_bearer = OAuth2PasswordBearer(tokenUrl='auth/token', auto_error=False)
 
 
 class CreateUserRequest(BaseModel):
@@ -51,19 +58,17 @@ class Token(BaseModel):
 
 db_dependency = Annotated[Session, Depends(get_db)]
 
-templates = Jinja2Templates(directory="todoApp/templates")
-
 # Load env once module imports
 load_dotenv()
 
 ##pages##
 @router.get("/login-page")
 def render_login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return render_page(request, "login.html")
 
 @router.get("/register-page")
 def render_register_page(request: Request):
-    return templates.TemplateResponse("register.html", {"request": request})
+    return render_page(request, "register.html")
 
 ##Endpoints##
 def authenticate_user(username: str, password: str, db):
@@ -82,19 +87,40 @@ def create_access_token(username: str, user_id: int, role: str, expires_delta: t
     return jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
+def decode_access_token(token: str):
+    """The user dict carried by a JWT, or None if it is invalid or expired."""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get('sub')
-        user_id: int = payload.get('id')
-        user_role: str = payload.get('role')  
-        if username is None or user_id is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                                detail='Could not validate user.')
-        return {'username': username, 'id': user_id, 'user_role': user_role} 
+        with phase('auth'), span('auth.jwt'):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
+        return None
+    username: str = payload.get('sub')
+    user_id: int = payload.get('id')
+    user_role: str = payload.get('role')
+    if username is None or user_id is None:
+        return None
+    return {'username': username, 'id': user_id, 'user_role': user_role}
+
+
+async def get_current_user(request: Request, token: Annotated[str | None, Depends(oauth2_bearer)]):
+    """
+    The verified principal, from an Authorization: Bearer header or else the
+    access_token cookie. Cookie-authenticated writes must pass the CSRF check.
+    """
+    user = None
+    if token:
+        user = decode_access_token(token)
+    else:
+        cookie = request.cookies.get('access_token')
+        if cookie:
+            user = decode_access_token(cookie)
+            if user is not None:
+                verify_csrf(request)
+    if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail='Could not validate user.')
+    start_profile(user)
+    return user
 
 
 # --- Google OAuth 2.0 ---
@@ -192,11 +218,14 @@ def google_callback(code: str | None = None, error: str | None = None, db: Annot
         db.add(user_model)
         db.commit()
         db.refresh(user_model)
+        invalidate_user(user_model.id)
+        publish_user_event('created', user_model.id)
 
     # Issue our JWT and redirect with cookie set
     token = create_access_token(user_model.username, user_model.id, user_model.role, timedelta(minutes=20))
     redirect = RedirectResponse(url='/todos/todo-page', status_code=302)
     redirect.set_cookie(key='access_token', value=token, path='/', secure=False, httponly=False, samesite='lax')
+    set_csrf_cookie(redirect)
     return redirect
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
@@ -217,15 +246,18 @@ async def create_user(db: db_dependency,
 
     db.add(create_user_model)
     db.commit()
+    invalidate_user(create_user_model.id)
+    publish_user_event('created', create_user_model.id)
 
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-                                 db: db_dependency):
+                                 db: db_dependency, response: Response):
     user = authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail='Could not validate user.')
     token = create_access_token(user.username, user.id, user.role, timedelta(minutes=20))
+    set_csrf_cookie(response)
 
     return {'access_token': token, 'token_type': 'bearer'}
\ No newline at end of file
@@ -1,22 +1,36 @@
 """
 Todo routes module with optimized database queries and centralized authentication.
 """
+import os
+from functools import partial
 from typing import Annotated
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends, HTTPException, Path, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, Request, Response
 from starlette import status
-from todoApp.models import Todos
+from starlette.concurrency import run_in_threadpool
+from todoApp.models import Todos, Users
 from todoApp.database import get_db
 from todoApp.routers.auth import get_current_user
-from fastapi.templating import Jinja2Templates
+from todoApp.search import search_todos, suggest_titles
+from todoApp.cache import invalidate_todos, todo_cache, todo_key, todo_list_key, todo_seq_key
+from todoApp.etag import CACHE_CONTROL, bump_todo_seq, etag_headers, etag_matches, make_etag, not_modified, set_etag
+from todoApp.negotiation import NegotiatedResponse
+from todoApp.schemas import TodoChangesResponse, TodoResponse, columns_for, rows_as_dicts
+from todoApp.sync import change_values, changes_since, missed_events, record_delete
+from todoApp.events import event_stream, publish_todo_event, start_stream
+from todoApp.templating import render_page, stream_page
+from todoApp.tracing import span
+from fastapi.responses import HTMLResponse, StreamingResponse
 
 router = APIRouter(
     prefix='/todos',
     tags=['todos']
 )
 
-templates = Jinja2Templates(directory="todoApp/templates")
+# Todos rendered into todo-page; longer lists are completed by the page's JS.
+TODO_PAGE_SIZE = int(os.environ.get('TODO_PAGE_SIZE', '100'))
 
 
 def get_authenticated_user(user: dict = Depends(get_current_user)):
@@ -34,34 +48,204 @@ class TodoRequest(BaseModel):
     description: str = Field(min_length=3, max_length=100)
     priority: int = Field(gt=0, lt=6)
     complete: bool
+    version: int | None = Field(default=None, gt=0)
 
 
-@router.get("/", status_code=status.HTTP_200_OK)
-async def get_all(user: user_depends, db: db_depends):
-    """Get all todos for the current user."""
-    return db.query(Todos).filter(Todos.owner_id == user['id']).all()
+class TodoPatchRequest(BaseModel):
+    title: str | None = Field(default=None, min_length=3)
+    description: str | None = Field(default=None, min_length=3, max_length=100)
+    priority: int | None = Field(default=None, gt=0, lt=6)
+    complete: bool | None = None
+    version: int | None = Field(default=None, gt=0)
 
+    @field_validator('title', 'description', 'priority', 'complete')
+    @classmethod
+    def reject_null(cls, value):
+        """Omitted fields keep their value (exclude_unset); an explicit null would write NULL, so it is a 422."""
+        if value is None:
+            raise ValueError('may be omitted but not null')
+        return value
 
-@router.get("/todo/{todo_id}", status_code=status.HTTP_200_OK)
-async def get_todo(user: user_depends, db: db_depends, todo_id: int = Path(gt=0)):
-    """Get a specific todo by ID."""
-    todo = (
-        db.query(Todos)
-        .filter(Todos.id == todo_id, Todos.owner_id == user['id'])
-        .one_or_none()
+
+def expected_version(body_version: int | None, if_match: str | None):
+    """
+    Version the client last saw, from the body or an If-Match: "<version>" header.
+
+    One of the two is required (428 otherwise), so a client that forgot to
+    send it cannot blindly overwrite a newer write. Only an explicit
+    If-Match: * asks for an unconditional update.
+    """
+    if body_version is not None:
+        return body_version
+    if if_match is None:
+        raise HTTPException(status_code=status.HTTP_428_PRECONDITION_REQUIRED,
+                            detail='Send the todo version you last read, in the body or If-Match')
+    if if_match.strip() == '*':
+        return None
+    tag = if_match.split(',')[0].strip().removeprefix('W/').strip('"')
+    try:
+        return int(tag.split('-')[0])
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid If-Match header')
+
+
+def compare_and_swap(db: Session, owner_id: int, todo_id: int, values: dict, version: int | None):
+    """
+    Write values only if the row is still at `version`; return the new version and todo seq.
+
+    A single UPDATE ... WHERE id = ? AND version = ? does the check, so no row
+    lock or prior SELECT is needed on the happy path.
+    """
+    seq = bump_todo_seq(db, owner_id)
+    stmt = update(Todos).where(Todos.id == todo_id, Todos.owner_id == owner_id)
+    if version is not None:
+        stmt = stmt.where(Todos.version == version)
+    new_version = db.execute(
+        stmt.values(**values, **change_values(seq), version=Todos.version + 1).returning(Todos.version)
+    ).scalar_one_or_none()
+
+    if new_version is None:
+        db.rollback()
+        exists = (
+            db.query(Todos.id)
+            .filter(Todos.id == todo_id, Todos.owner_id == owner_id)
+            .one_or_none()
+        )
+        if exists is None:
+            raise HTTPException(status_code=404, detail='Todo not found')
+        raise HTTPException(status_code=409, detail='Todo was changed by another request, reload and retry')
+
+    db.commit()
+    return new_version, seq
+
+
+TODO_COLUMNS = columns_for(Todos, TodoResponse)
+
+
+def todo_seq(db: Session, owner_id: int):
+    """The owner's todo change counter, through the cache."""
+    seq_key = todo_seq_key(owner_id)
+    with span('todos.seq', owner_id=owner_id) as current:
+        seq = todo_cache.get(seq_key)
+        if current is not None:
+            current.set('cache.hit', seq is not None)
+        if seq is None:
+            seq = db.query(Users.todo_seq).filter(Users.id == owner_id).scalar() or 0
+            todo_cache.set(seq_key, seq)
+    return seq
+
+
+def todo_list(db: Session, owner_id: int):
+    """The owner's todos as response dicts, through the cache."""
+    key = todo_list_key(owner_id)
+    with span('todos.list', owner_id=owner_id) as current:
+        todos = todo_cache.get(key)
+        if current is not None:
+            current.set('cache.hit', todos is not None)
+        if todos is None:
+            rows = db.execute(select(*TODO_COLUMNS).where(Todos.owner_id == owner_id)).all()
+            todos = rows_as_dicts(rows, TodoResponse)
+            todo_cache.set(key, todos)
+    return todos
+
+
+@router.get("/", status_code=status.HTTP_200_OK, response_model=list[TodoResponse])
+async def get_all(user: user_depends, db: db_depends, request: Request):
+    """Get all todos for the current user; 304 if the list is unchanged since the client's ETag."""
+    etag = make_etag('todos', user['id'], todo_seq(db, user['id']))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    # Already in response shape, so skip response_model validation.
+    return NegotiatedResponse(todo_list(db, user['id']), headers=etag_headers(etag))
+
+
+@router.get("/changes", status_code=status.HTTP_200_OK, response_model=TodoChangesResponse)
+async def get_changes(user: user_depends, db: db_depends, since: int = Query(ge=0)):
+    """Todos changed and ids deleted since the client's `seq`; resync=True means reload the list."""
+    return NegotiatedResponse(await run_in_threadpool(changes_since, db, user['id'], since))
+
+
+@router.get("/stream")
+async def stream(user: user_depends, db: db_depends, last_event_id: int | None = Header(default=None, ge=0)):
+    """Server-Sent Events announcing changes to the current user's todos; a reconnect first gets what it missed."""
+    catch_up = None if last_event_id is None else partial(missed_events, db, user['id'], last_event_id)
+    return StreamingResponse(
+        await start_stream(event_stream(user['id'], catch_up)),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
     )
-    if not todo:
-        raise HTTPException(status_code=404, detail="Todo not found")
+
+
+@router.get("/search", status_code=status.HTTP_200_OK, response_model=list[TodoResponse])
+async def search(
+    user: user_depends,
+    db: db_depends,
+    q: str = Query(min_length=1, max_length=100),
+    limit: int = Query(default=20, gt=0, le=100),
+    offset: int = Query(default=0, ge=0)
+):
+    """Full-text search over the current user's todos, best matches first."""
+    return await run_in_threadpool(search_todos, db, user['id'], q, limit=limit, offset=offset)
+
+
+@router.get("/suggest", status_code=status.HTTP_200_OK, response_model=list[str])
+async def suggest(
+    user: user_depends,
+    db: db_depends,
+    q: str = Query(min_length=1, max_length=100),
+    limit: int = Query(default=8, gt=0, le=20)
+):
+    """As-you-type title suggestions from the current user's todos."""
+    return await run_in_threadpool(suggest_titles, db, user['id'], q, limit=limit)
+
+
+@router.get("/todo/{todo_id}", status_code=status.HTTP_200_OK, response_model=TodoResponse)
+async def get_todo(
+    user: user_depends,
+    db: db_depends,
+    request: Request,
+    response: Response,
+    todo_id: int = Path(gt=0)
+):
+    """Get a specific todo by ID; 304 if its version still matches the client's ETag."""
+    key = todo_key(user['id'], todo_id)
+    todo = todo_cache.get(key)
+    if todo is None and request.headers.get('if-none-match'):
+        # Only the version is needed to answer a conditional request.
+        version = (
+            db.query(Todos.version)
+            .filter(Todos.id == todo_id, Todos.owner_id == user['id'])
+            .scalar()
+        )
+        if version is not None and etag_matches(request, make_etag(version)):
+            return not_modified(make_etag(version))
+
+    if todo is None:
+        row = db.execute(
+            select(*TODO_COLUMNS).where(Todos.id == todo_id, Todos.owner_id == user['id'])
+        ).one_or_none()
+        if not row:
+            raise HTTPException(status_code=404, detail="Todo not found")
+        todo = rows_as_dicts([row], TodoResponse)[0]
+        todo_cache.set(key, todo)
+
+    etag = make_etag(todo['version'])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     return todo
 
 
-@router.post("/todo", status_code=status.HTTP_201_CREATED)
+@router.post("/todo", status_code=status.HTTP_201_CREATED, response_model=TodoResponse)
 async def create_todo(user: user_depends, db: db_depends, todo_request: TodoRequest):
     """Create a new todo."""
-    todo_model = Todos(**todo_request.model_dump(), owner_id=user['id'])
+    seq = bump_todo_seq(db, user['id'])
+    todo_model = Todos(**todo_request.model_dump(exclude={'version'}), **change_values(seq), owner_id=user['id'])
     db.add(todo_model)
     db.commit()
     db.refresh(todo_model)
+    invalidate_todos(user['id'])
+    publish_todo_event(user['id'], 'created', todo_model.id, seq)
     return todo_model
 
 
@@ -70,38 +254,62 @@ async def update_todo(
     user: user_depends,
     db: db_depends,
     todo_request: TodoRequest,
-    todo_id: int = Path(gt=0)
+    response: Response,
+    todo_id: int = Path(gt=0),
+    if_match: str | None = Header(default=None)
 ):
-    """Update an existing todo."""
-    todo_model = (
-        db.query(Todos)
-        .filter(Todos.id == todo_id, Todos.owner_id == user['id'])
-        .one_or_none()
+    """Update an existing todo, rejecting the write with 409 if it changed since `version`."""
+    version, seq = compare_and_swap(
+        db, user['id'], todo_id,
+        todo_request.model_dump(exclude={'version'}),
+        expected_version(todo_request.version, if_match)
     )
-    if todo_model is None:
-        raise HTTPException(status_code=404, detail='Todo not found')
+    invalidate_todos(user['id'], todo_id)
+    publish_todo_event(user['id'], 'updated', todo_id, seq)
+    set_etag(response, make_etag(version))
 
-    # Bulk update using dictionary unpacking
-    for field, value in todo_request.model_dump().items():
-        setattr(todo_model, field, value)
-    
-    db.commit()
+
+@router.patch("/todo/{todo_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def patch_todo(
+    user: user_depends,
+    db: db_depends,
+    todo_request: TodoPatchRequest,
+    response: Response,
+    todo_id: int = Path(gt=0),
+    if_match: str | None = Header(default=None)
+):
+    """Update only the supplied fields; the UPDATE names just those columns."""
+    values = todo_request.model_dump(exclude_unset=True, exclude={'version'})
+    if not values:
+        raise HTTPException(status_code=400, detail='No fields to update')
+
+    version, seq = compare_and_swap(
+        db, user['id'], todo_id, values,
+        expected_version(todo_request.version, if_match)
+    )
+    invalidate_todos(user['id'], todo_id)
+    publish_todo_event(user['id'], 'updated', todo_id, seq)
+    set_etag(response, make_etag(version))
 
 
 @router.put("/todo/{todo_id}/toggle", status_code=status.HTTP_200_OK)
 async def toggle_todo(user: user_depends, db: db_depends, todo_id: int = Path(gt=0)):
     """Toggle todo completion status."""
-    todo_model = (
-        db.query(Todos)
-        .filter(Todos.id == todo_id, Todos.owner_id == user['id'])
-        .one_or_none()
-    )
-    if todo_model is None:
+    seq = bump_todo_seq(db, user['id'])
+    row = db.execute(
+        update(Todos)
+        .where(Todos.id == todo_id, Todos.owner_id == user['id'])
+        .values(complete=~Todos.complete, version=Todos.version + 1, **change_values(seq))
+        .returning(Todos.id, Todos.complete, Todos.version)
+    ).one_or_none()
+    if row is None:
+        db.rollback()
         raise HTTPException(status_code=404, detail='Todo not found')
-    
-    todo_model.complete = not todo_model.complete
+
     db.commit()
-    return {"id": todo_model.id, "complete": todo_model.complete}
+    invalidate_todos(user['id'], todo_id)
+    publish_todo_event(user['id'], 'updated', todo_id, seq)
+    return {"id": row.id, "complete": row.complete, "version": row.version}
 
 
 @router.delete("/todo/{todo_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -116,23 +324,39 @@ async def delete_todo(user: user_depends, db: db_depends, todo_id: int = Path(gt
         raise HTTPException(status_code=404, detail="Todo not found")
 
     db.delete(todo_model)
+    seq = bump_todo_seq(db, user['id'])
+    record_delete(db, user['id'], todo_id, seq)
     db.commit()
+    invalidate_todos(user['id'], todo_id)
+    publish_todo_event(user['id'], 'deleted', todo_id, seq)
 
 
 # Frontend template routes
-@router.get("/todo-page")
-def render_todo_page(request: Request):
-    """Render the main todo page."""
-    return templates.TemplateResponse("todo.html", {"request": request})
+# response_class=HTMLResponse marks a page: main.py redirects its 401s to the login page.
+@router.get("/todo-page", response_class=HTMLResponse)
+def render_todo_page(request: Request, user: user_depends, db: db_depends):
+    """Render the main todo page with the user's first page of todos already in it."""
+    seq = todo_seq(db, user['id'])
+    todos = todo_list(db, user['id'])
+    # The page's JS keeps these items, only refetches the list when it is cut
+    # short, and afterwards pulls just the changes since `seq`.
+    state = {
+        'seq': seq,
+        'etag': make_etag('todos', user['id'], seq),
+        'count': len(todos),
+        'complete': len(todos) <= TODO_PAGE_SIZE,
+    }
+    return stream_page(request, "todo.html", headers={'Cache-Control': CACHE_CONTROL},
+                       todos=todos[:TODO_PAGE_SIZE], state=state)
 
 
-@router.get("/edit/{todo_id}")
-def render_edit_todo_page(request: Request, todo_id: int):
+@router.get("/edit/{todo_id}", response_class=HTMLResponse)
+def render_edit_todo_page(request: Request, user: user_depends, todo_id: int):
     """Render the edit todo page."""
-    return templates.TemplateResponse("edit_todo.html", {"request": request, "todo_id": todo_id})
+    return render_page(request, "edit_todo.html", todo_id=todo_id)
 
 
-@router.get("/view/{todo_id}")
-def render_view_todo_page(request: Request, todo_id: int):
+@router.get("/view/{todo_id}", response_class=HTMLResponse)
+def render_view_todo_page(request: Request, user: user_depends, todo_id: int):
     """Render the view todo page."""
-    return templates.TemplateResponse("view_todo.html", {"request": request, "todo_id": todo_id})
\ No newline at end of file
+    return render_page(request, "view_todo.html", todo_id=todo_id)
\ No newline at end of file
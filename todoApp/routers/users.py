@@ -1,13 +1,18 @@
 from typing import Annotated
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends, HTTPException, Path, Request
+from fastapi import APIRouter, Depends, HTTPException, Path, Request, Response
 from starlette import status
 from todoApp.models import Users
 from todoApp.database import SessionLocal
+from todoApp.timing import checkout
 from todoApp.routers.auth import get_current_user
+from todoApp.etag import etag_matches, make_etag, not_modified, set_etag
+from todoApp.cache import invalidate_user, todo_cache, user_key
+from todoApp.events import publish_user_event
+from todoApp.schemas import UserResponse
+from todoApp.templating import render_page
 from passlib.context import CryptContext
-from fastapi.templating import Jinja2Templates
 
 router = APIRouter(
     prefix = '/users',
@@ -17,6 +22,7 @@ router = APIRouter(
 def get_db():
     db = SessionLocal()
     try:
+        checkout(db)
         yield db
     finally:
         db.close()
@@ -24,17 +30,25 @@ def get_db():
 db_dependency = Annotated[Session, Depends(get_db)]
 user_dependency = Annotated[dict, Depends(get_current_user)]
 bcrypt_context = CryptContext(schemes=['bcrypt'] , deprecated = 'auto')
-templates = Jinja2Templates(directory="todoApp/templates")
-
 class UserVerification(BaseModel):
     password:str
     new_password: str = Field(min_length=6)
 
-@router.get('/', status_code=status.HTTP_200_OK)
-async def get_user(user: user_dependency, db: db_dependency):
+@router.get('/', status_code=status.HTTP_200_OK, response_model=UserResponse)
+async def get_user(user: user_dependency, db: db_dependency, request: Request, response: Response):
     if user is None:
         raise HTTPException(status_code=401, detail='Authentication Failed')
-    return db.query(Users).filter(Users.id == user.get('id')).first()
+    if request.headers.get('if-none-match'):
+        version = todo_cache.get(user_key(user.get('id')))
+        if version is None:
+            version = db.query(Users.version).filter(Users.id == user.get('id')).scalar()
+            todo_cache.set(user_key(user.get('id')), version)
+        if version is not None and etag_matches(request, make_etag(user.get('id'), version)):
+            return not_modified(make_etag(user.get('id'), version))
+    user_model = db.query(Users).filter(Users.id == user.get('id')).first()
+    if user_model is not None:
+        set_etag(response, make_etag(user_model.id, user_model.version))
+    return user_model
 
 @router.put("/password", status_code=status.HTTP_204_NO_CONTENT)
 async def change_password(user: user_dependency, db: db_dependency, user_verification: UserVerification):
@@ -46,8 +60,11 @@ async def change_password(user: user_dependency, db: db_dependency, user_verific
     if not bcrypt_context.verify(user_verification.password, user_model.hashed_password):
          raise HTTPException(status_code=401, detail='Error on password change')
     user_model.hashed_password = bcrypt_context.hash(user_verification.new_password)
+    user_model.version = Users.version + 1
     db.add(user_model)
     db.commit()
+    invalidate_user(user.get('id'))
+    publish_user_event('updated', user.get('id'))
 
 @router.put("/phonenumber/{phone_number}", status_code=status.HTTP_204_NO_CONTENT)
 async def change_phone_number(user : user_dependency , db: db_dependency , phone_number: str ):
@@ -55,8 +72,11 @@ async def change_phone_number(user : user_dependency , db: db_dependency , phone
            raise HTTPException(status_code=401, detail='Authentication Failed')
     user_model = db.query(Users).filter(Users.id == user.get('id')).first()
     user_model.phone_number = phone_number
+    user_model.version = Users.version + 1
     db.add(user_model)
     db.commit()
+    invalidate_user(user.get('id'))
+    publish_user_event('updated', user.get('id'))
     
 
 @router.put("/phonenumber/{phone_number}", status_code=status.HTTP_204_NO_CONTENT)
@@ -65,8 +85,11 @@ async def change_phone_number(user: user_dependency, db: db_dependency , phone_n
             raise HTTPException(status_code=401, detail='Authentication Failed')
      user_model = db.query(Users).filter(Users.id == user.get('id')).first()
      user_model.phone_number = phone_number
+     user_model.version = Users.version + 1
      db.add(user_model)
      db.commit()
+     invalidate_user(user.get('id'))
+     publish_user_event('updated', user.get('id'))
           
 
 
@@ -77,10 +100,13 @@ async def change_address(user: user_dependency, db:db_dependency,address: str):
             raise HTTPException(status_code=401, detail='Authentication Failed')
      user_model = db.query(Users).filter(Users.id == user.get('id')).first()
      user_model.address = address
+     user_model.version = Users.version + 1
      db.add(user_model)
      db.commit()
+     invalidate_user(user.get('id'))
+     publish_user_event('updated', user.get('id'))
 
 @router.get("/profile-page")
 def render_profile_page(request: Request):
-    return templates.TemplateResponse("profile.html", {"request": request})
+    return render_page(request, "profile.html")
           
\ No newline at end of file
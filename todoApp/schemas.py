@@ -0,0 +1,77 @@
+"""
+Response models shared by the routers.
+
+List endpoints select exactly these fields as plain columns and turn the row
+tuples into dicts with rows_as_dicts(), skipping ORM instances and
+jsonable_encoder on the hot path.
+"""
+from pydantic import BaseModel, ConfigDict
+
+
+class TodoResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    title: str | None
+    description: str | None
+    priority: int | None
+    complete: bool | None
+    owner_id: int | None
+    version: int
+
+
+class UserResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    email: str | None
+    username: str | None
+    first_name: str | None
+    last_name: str | None
+    is_active: bool | None
+    role: str | None
+    address: str | None
+    phone_number: str | None
+    version: int
+
+
+class TodoChangesResponse(BaseModel):
+    seq: int
+    resync: bool
+    todos: list[TodoResponse]
+    deleted: list[int]
+
+
+class StatsResponse(BaseModel):
+    total_users: int
+    total_todos: int
+    completed_todos: int
+    pending_todos: int
+
+
+class AdminUserRow(BaseModel):
+    id: int
+    username: str | None
+    email: str | None
+    role: str | None
+    is_active: bool | None
+    todo_count: int
+    completed_count: int
+
+
+class AdminOverviewResponse(BaseModel):
+    stats: StatsResponse
+    users: list[AdminUserRow]
+    total: int
+    limit: int
+    offset: int
+
+
+def columns_for(model, schema: type[BaseModel]):
+    """The model's columns for each field of schema, in field order."""
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+def rows_as_dicts(rows, schema: type[BaseModel]):
+    fields = tuple(schema.model_fields)
+    return [dict(zip(fields, row)) for row in rows]
@@ -0,0 +1,207 @@
+"""
+Full-text search and title autocomplete over todos.
+
+Postgres keeps a generated tsvector column with a GIN index on todos plus a
+pg_trgm index on (owner_id, title); SQLite uses an FTS5 external-content
+table kept in sync by triggers. Both are queried through search_todos() and
+suggest_titles().
+
+The Postgres column and index rewrite the table under an exclusive lock, so
+only the Alembic migrations (b81d4e6a0c52 and c4e7a2f19d83) create
+them; workers never run that DDL. ensure_search_index() sets up the SQLite FTS5 table at startup.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import column, func, inspect, literal, literal_column, or_, select, table, text
+from sqlalchemy.orm import Session
+
+from todoApp.models import Todos
+
+SEARCH_CONFIG = 'english'
+
+_SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts
+    USING fts5(title, description, content='todos', content_rowid='id')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_ai AFTER INSERT ON todos BEGIN
+        INSERT INTO todos_fts (rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_ad AFTER DELETE ON todos BEGIN
+        INSERT INTO todos_fts (todos_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_au AFTER UPDATE OF title, description ON todos BEGIN
+        INSERT INTO todos_fts (todos_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO todos_fts (rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+_todos_fts = table('todos_fts', column('rowid'))
+
+
+def ensure_search_index(engine):
+    """Create the FTS5 table and triggers (SQLite) if missing; Postgres indexes come from Alembic."""
+    if engine.dialect.name == 'sqlite':
+        is_new = 'todos_fts' not in inspect(engine).get_table_names()
+        with engine.begin() as conn:
+            for ddl in _SQLITE_DDL:
+                conn.execute(text(ddl))
+            if is_new:
+                # Index the rows that were there before the FTS table existed.
+                conn.execute(text("INSERT INTO todos_fts (todos_fts) VALUES ('rebuild')"))
+
+
+def _fts5_query(q: str):
+    """Turn free text into a safe FTS5 expression: quoted terms, prefix on the last."""
+    terms = re.findall(r'\w+', q)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_todos(db: Session, owner_id: int, q: str, limit: int = 20, offset: int = 0):
+    """Return the owner's todos matching q, best match first."""
+    dialect = db.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        vector = literal_column('todos.search_vector')
+        rank = func.ts_rank_cd(vector, query)
+        stmt = (
+            select(Todos)
+            .where(Todos.owner_id == owner_id, vector.op('@@')(query))
+            .order_by(rank.desc(), Todos.id.desc())
+        )
+    elif dialect == 'sqlite':
+        match = _fts5_query(q)
+        if match is None:
+            return []
+        stmt = (
+            select(Todos)
+            .join(_todos_fts, _todos_fts.c.rowid == Todos.id)
+            .where(Todos.owner_id == owner_id, literal_column('todos_fts').op('MATCH')(match))
+            .order_by(func.bm25(literal_column('todos_fts')), Todos.id.desc())
+        )
+    else:
+        pattern = f'%{q}%'
+        stmt = (
+            select(Todos)
+            .where(Todos.owner_id == owner_id,
+                   Todos.title.ilike(pattern) | Todos.description.ilike(pattern))
+            .order_by(Todos.id.desc())
+        )
+
+    return db.execute(stmt.limit(limit).offset(offset)).scalars().all()
+
+
+class SuggestionCache:
+    """Small per-user LRU of prefix -> titles, dropped whenever the user's todos change."""
+
+    def __init__(self, max_users: int = 1024, max_prefixes: int = 64, ttl: float = 60.0):
+        self.max_users = max_users
+        self.max_prefixes = max_prefixes
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, owner_id: int, prefix: str):
+        with self._lock:
+            prefixes = self._users.get(owner_id)
+            if prefixes is None or prefix not in prefixes:
+                return None
+            expires, titles = prefixes[prefix]
+            if expires < time.monotonic():
+                del prefixes[prefix]
+                return None
+            self._users.move_to_end(owner_id)
+            prefixes.move_to_end(prefix)
+            return titles
+
+    def set(self, owner_id: int, prefix: str, titles: list):
+        with self._lock:
+            prefixes = self._users.setdefault(owner_id, OrderedDict())
+            self._users.move_to_end(owner_id)
+            prefixes[prefix] = (time.monotonic() + self.ttl, titles)
+            prefixes.move_to_end(prefix)
+            if len(prefixes) > self.max_prefixes:
+                prefixes.popitem(last=False)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, owner_id: int):
+        with self._lock:
+            self._users.pop(owner_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+suggestion_cache = SuggestionCache()
+
+
+def _escape_like(value: str):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def suggest_titles(db: Session, owner_id: int, q: str, limit: int = 8):
+    """Titles of the owner's todos that start with, or are a close fuzzy match for, q."""
+    prefix = q.strip().lower()
+    if not prefix:
+        return []
+    key = f'{limit}:{prefix}'
+    cached = suggestion_cache.get(owner_id, key)
+    if cached is not None:
+        return cached
+
+    dialect = db.get_bind().dialect.name
+    starts_with = Todos.title.ilike(_escape_like(prefix) + '%', escape='\\')
+
+    if dialect == 'postgresql':
+        # `<%` is pg_trgm word similarity, so "grocries" still finds "Buy groceries".
+        stmt = (
+            select(Todos.title)
+            .where(Todos.owner_id == owner_id,
+                   or_(starts_with, literal(prefix).op('<%')(Todos.title)))
+            .group_by(Todos.title)
+            .order_by(func.max(func.word_similarity(prefix, Todos.title)).desc(), Todos.title)
+            .limit(limit)
+        )
+    elif dialect == 'sqlite' and _fts5_query(prefix) is not None:
+        # bm25() cannot sit under GROUP BY (even in a flattened subquery), so
+        # over-fetch ranked rows and drop duplicate titles here instead.
+        stmt = (
+            select(Todos.title)
+            .join(_todos_fts, _todos_fts.c.rowid == Todos.id)
+            .where(Todos.owner_id == owner_id,
+                   literal_column('todos_fts').op('MATCH')(f'{{title}} : ({_fts5_query(prefix)})'))
+            .order_by(func.bm25(literal_column('todos_fts')), Todos.title)
+            .limit(limit * 4)
+        )
+    else:
+        stmt = (
+            select(Todos.title)
+            .where(Todos.owner_id == owner_id, starts_with)
+            .group_by(Todos.title)
+            .order_by(Todos.title)
+            .limit(limit)
+        )
+
+    titles = list(dict.fromkeys(db.execute(stmt).scalars()))[:limit]
+    suggestion_cache.set(owner_id, key, titles)
+    return titles
@@ -27,6 +27,9 @@
 
                 if (response.ok) {
                     form.reset(); // Clear the form
+                    if (typeof syncTodos === 'function') {
+                        syncTodos(); // Pull the new todo into the list
+                    }
                 } else {
                     // Handle error
                     const errorData = await response.json();
@@ -54,7 +57,9 @@
             title: data.title,
             description: data.description,
             priority: parseInt(data.priority),
-            complete: data.complete === "on"
+            complete: data.complete === "on",
+            // Required: the server refuses updates that don't say which version they edit.
+            version: parseInt(data.version)
         };
 
         try {
@@ -136,6 +141,9 @@
                 payload.append(key, value);
             }
 
+            // Clear the old session first: the response sets a new csrf_token cookie.
+            clearCookies();
+
             try {
                 const response = await fetch('/auth/token', {
                     method: 'POST',
@@ -148,8 +156,6 @@
                 if (response.ok) {
                     // Handle success (e.g., redirect to dashboard)
                     const data = await response.json();
-                    // Delete any cookies available
-                    logout();
                     // Save token to cookie
                     document.cookie = `access_token=${data.access_token}; path=/`;
                     window.location.href = '/todos/todo-page'; // Change this to your desired redirect page
@@ -234,7 +240,17 @@
         return cookieValue;
     };
 
-    function logout() {
+    // Helper to put user-supplied text into an HTML template string safely
+    function escapeHtml(value) {
+        return String(value ?? '')
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;')
+            .replace(/'/g, '&#39;');
+    };
+
+    function clearCookies() {
         // Get all cookies
         const cookies = document.cookie.split(";");
     
@@ -246,7 +262,11 @@
             // Set the cookie's expiry date to a past date to delete it
             document.cookie = name + "=;expires=Thu, 01 Jan 1970 00:00:00 GMT;path=/";
         }
-    
+    };
+
+    function logout() {
+        clearCookies();
+
         // Redirect to the login page
         window.location.href = '/auth/login-page';
     };
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+Delta sync for todo lists.
+
+Every change to a user's todos advances users.todo_seq (bump_todo_seq in
+etag.py). The changed row records that value in todos.seq. A delete leaves a
+TodoTombstones row carrying the seq of the delete. So changes_since(N)
+returns exactly what a client holding the list as of seq N is missing.
+
+Deletes prune tombstones more than TODO_SYNC_MAX_LAG changes old. A client
+further behind than that gets resync=True and reloads the whole list.
+
+missed_events(N) is the same delta as /todos/stream events, for a stream
+that reconnects with Last-Event-ID: N.
+"""
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from todoApp.events import RESYNC
+from todoApp.models import Todos, TodoTombstones, Users
+from todoApp.schemas import TodoResponse, columns_for, rows_as_dicts
+
+TODO_SYNC_MAX_LAG = int(os.environ.get('TODO_SYNC_MAX_LAG', '1000'))
+
+_COLUMNS = columns_for(Todos, TodoResponse)
+
+
+def change_values(seq: int):
+    """Column values that stamp a todo as changed at seq."""
+    return {'seq': seq, 'updated_at': datetime.now(timezone.utc)}
+
+
+def record_delete(db: Session, owner_id: int, todo_id: int, seq: int):
+    """Leave a tombstone for todo_id and prune those no client can still need."""
+    db.execute(insert(TodoTombstones).values(
+        owner_id=owner_id, todo_id=todo_id, seq=seq, deleted_at=datetime.now(timezone.utc)
+    ))
+    db.execute(delete(TodoTombstones).where(
+        TodoTombstones.owner_id == owner_id,
+        TodoTombstones.seq <= seq - TODO_SYNC_MAX_LAG,
+    ))
+
+
+def _too_far_behind(current: int, since: int):
+    return since > current or current - since > TODO_SYNC_MAX_LAG
+
+
+def changes_since(db: Session, owner_id: int, since: int):
+    current = db.query(Users.todo_seq).filter(Users.id == owner_id).scalar() or 0
+    if _too_far_behind(current, since):
+        return {'seq': current, 'resync': True, 'todos': [], 'deleted': []}
+    if since == current:
+        return {'seq': current, 'resync': False, 'todos': [], 'deleted': []}
+
+    rows = db.execute(
+        select(*_COLUMNS, Todos.seq).where(Todos.owner_id == owner_id, Todos.seq > since)
+    ).all()
+    tombstones = db.execute(
+        select(TodoTombstones.todo_id, TodoTombstones.seq)
+        .where(TodoTombstones.owner_id == owner_id, TodoTombstones.seq > since)
+    ).all()
+
+    # An id can come back after a delete (SQLite reuses the highest rowid), so
+    # a tombstone only counts if it is newer than the live row with that id.
+    live = {row.id: row.seq for row in rows}
+    deleted = sorted({todo_id for todo_id, seq in tombstones if live.get(todo_id, -1) < seq})
+    seq = max([current, *live.values(), *(seq for _, seq in tombstones)])
+    return {
+        'seq': seq,
+        'resync': False,
+        'todos': rows_as_dicts(rows, TodoResponse),
+        'deleted': deleted,
+    }
+
+
+def missed_events(db: Session, owner_id: int, since: int):
+    """Stream events for every change after seq `since`, oldest first; a single resync if too far behind."""
+    current = db.query(Users.todo_seq).filter(Users.id == owner_id).scalar() or 0
+    if _too_far_behind(current, since):
+        return [RESYNC]
+    rows = db.execute(
+        select(Todos.id, Todos.seq).where(Todos.owner_id == owner_id, Todos.seq > since)
+    ).all()
+    tombstones = db.execute(
+        select(TodoTombstones.todo_id, TodoTombstones.seq)
+        .where(TodoTombstones.owner_id == owner_id, TodoTombstones.seq > since)
+    ).all()
+    # Creates and updates look alike here; clients only act on the seq.
+    live = dict(rows)
+    events = [{'type': 'updated', 'id': todo_id, 'seq': seq} for todo_id, seq in rows]
+    events += [{'type': 'deleted', 'id': todo_id, 'seq': seq}
+               for todo_id, seq in tombstones if live.get(todo_id, -1) < seq]
+    return sorted(events, key=lambda event: event['seq'])
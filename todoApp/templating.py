@@ -0,0 +1,106 @@
+"""
+The app's single Jinja environment and rendered-page cache.
+
+All routers render through render_page() or stream_page() here. `env`
+keeps compiled templates in a FileSystemBytecodeCache (TEMPLATE_CACHE_DIR),
+so a restarted worker loads bytecode instead of re-parsing. precompile_templates() runs in
+the lifespan, so the first request for a page never pays for compilation.
+
+Most pages are static shells whose data is fetched by JS. render_page()
+renders each shell once per (template, base URL, context) and serves the
+cached bytes with a strong ETag, so repeat views are answered with a 304.
+Pages built from per-user data go through stream_page() instead, which
+streams Template.generate() so the head reaches the browser before a long
+list has finished rendering.
+
+Set TEMPLATE_AUTO_RELOAD=1 in development to pick up template edits and skip
+the page cache.
+"""
+import hashlib
+import os
+import tempfile
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+from todoApp.assets import static_url
+from todoApp.cache import LRUCache
+from todoApp.etag import etag_matches
+from todoApp.tracing import span, start_span
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'todoapp-jinja'))
+TEMPLATE_AUTO_RELOAD = os.environ.get('TEMPLATE_AUTO_RELOAD', '0') == '1'
+# Keys include the request's base URL, which comes from the Host header, so
+# the cache is bounded rather than keyed on an open-ended set.
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', '512'))
+
+PAGE_CACHE_CONTROL = 'no-cache'
+# Streamed pages are flushed in chunks of about this many characters rather
+# than one write per template event.
+STREAM_CHUNK_SIZE = 8192
+
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+
+env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(),
+    bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+)
+env.globals['static_url'] = static_url
+
+page_cache = LRUCache(maxsize=PAGE_CACHE_SIZE, ttl=float('inf'))
+
+
+def precompile_templates():
+    """Compile every template into the environment (and the bytecode cache)."""
+    for name in env.list_templates(extensions=['html']):
+        env.get_template(name)
+
+
+def _render(request: Request, name: str, context: dict):
+    with span('template.render', template=name):
+        body = env.get_template(name).render({'request': request, **context}).encode()
+    return body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def render_page(request: Request, name: str, **context):
+    """Serve a static page shell from the rendered-page cache, 304 when unchanged."""
+    key = (name, str(request.base_url), tuple(sorted(context.items())))
+    entry = None if TEMPLATE_AUTO_RELOAD else page_cache.get(key)
+    if entry is None:
+        entry = _render(request, name, context)
+        if not TEMPLATE_AUTO_RELOAD:
+            page_cache.set(key, entry)
+    body, etag = entry
+    headers = {'ETag': etag, 'Cache-Control': PAGE_CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(body, headers=headers)
+
+
+def _buffered(chunks, trace_span=None):
+    buffer, size = [], 0
+    try:
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= STREAM_CHUNK_SIZE:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        # Rendering happens as the body streams, on threadpool threads, so
+        # the span is ended here rather than scoped to stream_page().
+        if trace_span is not None:
+            trace_span.end()
+
+
+def stream_page(request: Request, name: str, headers: dict | None = None, **context):
+    """Stream a per-request page as the template renders it."""
+    trace_span = start_span('template.render', template=name, streamed=True)
+    chunks = env.get_template(name).generate({'request': request, **context})
+    return StreamingResponse(_buffered(chunks, trace_span), media_type='text/html; charset=utf-8', headers=headers)
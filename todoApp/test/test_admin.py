@@ -0,0 +1,85 @@
+from fastapi import status
+from ..models import Todos
+from ..routers import admin
+from ..routers.auth import get_current_user
+from ..cache import admin_cache
+from ..database import get_db
+from .utils import *
+
+app.dependency_overrides[admin.get_db] = override_get_db
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+admin_cache.session_factory = TestingSessionLocal
+
+
+def test_admin_read_all_and_stats(test_todo):
+    admin_cache.invalidate()
+
+    response = client.get("/admin/todo")
+    assert response.status_code == status.HTTP_200_OK
+    assert [todo['title'] for todo in response.json()] == ['Learn to code!']
+
+    response = client.get("/admin/stats")
+    assert response.json() == {'total_users': 1, 'total_todos': 1,
+                               'completed_todos': 0, 'pending_todos': 1}
+
+
+def test_admin_delete_todo_refreshes_cached_aggregates(test_todo):
+    admin_cache.invalidate()
+    assert client.get("/admin/stats").json()['total_todos'] == 1
+
+    response = client.delete(f"/admin/todo/{test_todo.id}")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    db = TestingSessionLocal()
+    assert db.query(Todos).filter(Todos.id == test_todo.id).first() is None
+    assert client.get("/admin/stats").json()['total_todos'] == 0
+    assert client.get("/admin/todo").json() == []
+
+
+def test_admin_overview_counts_and_search(test_todo):
+    admin_cache.invalidate()
+    db = TestingSessionLocal()
+    db.add(Todos(title='Done already', description='Finished task', priority=1,
+                 complete=True, owner_id=test_todo.owner_id))
+    db.commit()
+
+    response = client.get("/admin/overview")
+    assert response.status_code == status.HTTP_200_OK
+    body = response.json()
+    assert body['stats']['total_todos'] == 2
+    assert body['total'] == 1
+    assert body['users'][0]['username'] == 'codingwithtest'
+    assert body['users'][0]['todo_count'] == 2
+    assert body['users'][0]['completed_count'] == 1
+
+    assert client.get("/admin/overview", params={'q': 'CODING'}).json()['total'] == 1
+    assert client.get("/admin/overview", params={'q': 'coding_'}).json()['users'] == []
+    assert client.get("/admin/overview", params={'sort': 'password'}).status_code == 422
+
+
+def test_admin_list_users_query_budget(test_todo):
+    admin_cache.invalidate()
+    with assert_max_queries(1):
+        assert client.get("/admin/users").status_code == status.HTTP_200_OK
+    with assert_max_queries(0):
+        client.get("/admin/users")
+    # The user page, the match count and the two stats aggregates.
+    with assert_max_queries(4):
+        client.get("/admin/overview")
+
+
+def test_admin_lists_reflect_user_writes_at_once(test_todo):
+    admin_cache.invalidate()
+    assert len(client.get("/admin/todo").json()) == 1
+    assert client.get("/admin/stats").json()['total_todos'] == 1
+
+    response = client.post("/todos/todo", json={'title': 'Fresh todo', 'description': 'Seen by the admin',
+                                                'priority': 2, 'complete': False})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert 'Fresh todo' in [todo['title'] for todo in client.get("/admin/todo").json()]
+    assert client.get("/admin/stats").json()['total_todos'] == 2
+
+
+def test_admin_stream_is_unavailable_without_the_lifespan():
+    # This client never ran the lifespan, so the feed was not started.
+    assert client.get("/admin/stream").status_code == status.HTTP_503_SERVICE_UNAVAILABLE
@@ -0,0 +1,55 @@
+import gzip
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from ..assets import IMMUTABLE, PrecompressedStaticFiles, build
+from ..compression import CompressionMiddleware
+
+
+def test_large_responses_are_compressed_small_ones_are_not():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get('/big')
+    def big():
+        return {'items': ['todo'] * 200}
+
+    @app.get('/small')
+    def small():
+        return {'ok': True}
+
+    client = TestClient(app)
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['vary']
+    assert response.json() == {'items': ['todo'] * 200}
+
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in response.headers
+
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'content-encoding' not in response.headers
+
+
+def test_built_assets_are_hashed_precompressed_and_immutable(tmp_path):
+    css = b'body { color: #333; }\n' * 100
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'site.css').write_bytes(css)
+    manifest = build(tmp_path)
+    hashed = manifest['css/site.css']
+    assert hashed.startswith('dist/css/site.') and hashed.endswith('.css')
+    assert gzip.decompress((tmp_path / (hashed + '.gz')).read_bytes()) == css
+
+    app = FastAPI()
+    app.mount('/static', PrecompressedStaticFiles(directory=tmp_path), name='static')
+    client = TestClient(app)
+
+    response = client.get(f'/static/{hashed}', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['content-type'].startswith('text/css')
+    assert response.headers['cache-control'] == IMMUTABLE
+    assert response.content == css
+
+    response = client.get('/static/css/site.css', headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in response.headers
+    assert response.headers['cache-control'] != IMMUTABLE
@@ -0,0 +1,44 @@
+from datetime import timedelta
+from typing import Annotated
+from fastapi import Depends, FastAPI, status
+from fastapi.testclient import TestClient
+from ..routers.auth import create_access_token, get_current_user
+
+app = FastAPI()
+
+
+@app.get('/me')
+async def me(user: Annotated[dict, Depends(get_current_user)]):
+    return user
+
+
+@app.post('/me')
+async def update_me(user: Annotated[dict, Depends(get_current_user)]):
+    return user
+
+
+token = create_access_token('codingwithtest', 1, 'admin', timedelta(minutes=5))
+
+
+def test_bearer_header_and_cookie_identify_the_same_user():
+    client = TestClient(app)
+    by_header = client.get('/me', headers={'Authorization': f'Bearer {token}'})
+    assert by_header.status_code == status.HTTP_200_OK
+    assert by_header.json()['id'] == 1
+
+    client.cookies.set('access_token', token)
+    assert client.get('/me').json() == by_header.json()
+
+    assert TestClient(app).get('/me').status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_cookie_authenticated_writes_need_matching_csrf_token():
+    client = TestClient(app)
+    client.cookies.set('access_token', token)
+    client.cookies.set('csrf_token', 'expected')
+
+    assert client.post('/me').status_code == status.HTTP_403_FORBIDDEN
+    assert client.post('/me', headers={'X-CSRF-Token': 'forged'}).status_code == status.HTTP_403_FORBIDDEN
+    assert client.post('/me', headers={'X-CSRF-Token': 'expected'}).status_code == status.HTTP_200_OK
+    # Bearer requests can't be forged cross-site, so they skip the check.
+    assert client.post('/me', headers={'Authorization': f'Bearer {token}'}).status_code == status.HTTP_200_OK
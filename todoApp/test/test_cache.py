@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+from ..cache import LRUCache, SingleFlightCache
+
+
+def test_lru_evicts_least_recently_used_and_expires():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.stats()['evictions'] == 1
+
+    cache.set('d', 4, ttl=-1)
+    assert cache.get('d') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_single_flight_shares_one_computation():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return {'total_todos': len(calls)}
+
+    async def run():
+        cache = SingleFlightCache(ttl=60, stale_ttl=0)
+        return await asyncio.gather(*(cache.get('stats', compute) for _ in range(20)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result == {'total_todos': 1} for result in results)
+
+
+def test_stale_entry_is_served_while_refreshing():
+    values = iter([1, 2])
+
+    async def run():
+        cache = SingleFlightCache(ttl=0, stale_ttl=60)
+        first = await cache.get('k', lambda: next(values))
+        stale = await cache.get('k', lambda: next(values))
+        await asyncio.sleep(0.05)
+        cache.ttl = 60
+        fresh = await cache.get('k', lambda: next(values))
+        return first, stale, fresh
+
+    assert asyncio.run(run()) == (1, 1, 2)
+
+
+def test_invalidated_computation_does_not_drop_the_newer_one():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return len(calls)
+
+    async def run():
+        cache = SingleFlightCache(ttl=60, stale_ttl=0)
+        old = asyncio.ensure_future(cache.get('stats', compute))
+        await asyncio.sleep(0.01)
+        cache.invalidate()
+        new = asyncio.ensure_future(cache.get('stats', compute))
+        await asyncio.sleep(0.01)
+        await old
+        # The first computation finished; a third caller must join the second, not start another.
+        return await asyncio.gather(new, cache.get('stats', compute))
+
+    assert asyncio.run(run()) == [2, 2]
+    assert len(calls) == 2
+
+
+def test_invalidate_from_another_thread_runs_on_the_loop():
+    async def run():
+        cache = SingleFlightCache(ttl=60, stale_ttl=0)
+        await cache.get('stats', lambda: 1)
+        seen = []
+        original = cache._invalidate
+        cache._invalidate = lambda keys: (seen.append(threading.get_ident()), original(keys))
+        await asyncio.to_thread(cache.invalidate)
+        await asyncio.sleep(0)
+        return seen, threading.get_ident(), cache.stats()['size']
+
+    seen, loop_thread, size = asyncio.run(run())
+    assert seen == [loop_thread]
+    assert size == 0
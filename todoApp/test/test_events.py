@@ -0,0 +1,62 @@
+import asyncio
+import json
+from ..admin_feed import AdminFeed
+from ..events import RESYNC, EventHub, format_sse, todo_events
+
+
+def test_hub_delivers_to_the_owners_streams_only():
+    async def run():
+        hub = EventHub()
+        mine, theirs = hub.subscribe(1), hub.subscribe(2)
+        hub.dispatch(1, {'type': 'created', 'id': 7, 'seq': 3})
+        event = await mine.get(timeout=1)
+        assert theirs.queue.empty()
+        hub.unsubscribe(mine)
+        hub.unsubscribe(theirs)
+        return event, hub.stats()
+
+    event, stats = asyncio.run(run())
+    assert event == {'type': 'created', 'id': 7, 'seq': 3}
+    assert stats == {'users': 0, 'streams': 0}
+    assert format_sse(event) == 'id: 3\nevent: created\ndata: {"type":"created","id":7,"seq":3}\n\n'
+
+
+def test_slow_subscriber_gets_a_single_resync_instead_of_a_backlog():
+    async def run():
+        hub = EventHub()
+        subscription = hub.subscribe(1)
+        for seq in range(subscription.queue.maxsize + 5):
+            hub.dispatch(1, {'type': 'updated', 'id': 1, 'seq': seq})
+        await asyncio.sleep(0)
+        return [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+
+    events = asyncio.run(run())
+    assert events[0] == RESYNC
+    assert len(events) == 5
+
+
+def test_admin_feed_coalesces_a_burst_into_one_delta():
+    counts = {'total_todos': 1, 'completed_todos': 0}
+
+    async def run():
+        feed = AdminFeed(lambda: dict(counts))
+        feed.start()
+        stream = feed.stream()
+        try:
+            assert await stream.__anext__() == 'retry: 5000\n\n'
+            snapshot = await stream.__anext__()
+            for todo_id in range(5):
+                counts['total_todos'] += 1
+                todo_events.hub.dispatch(1, {'type': 'created', 'id': todo_id, 'seq': todo_id})
+            delta = await asyncio.wait_for(stream.__anext__(), 2)
+        finally:
+            await stream.aclose()
+            await feed.stop()
+        assert feed._on_event not in todo_events.hub._listeners
+        return snapshot, delta
+
+    snapshot, delta = asyncio.run(run())
+    assert snapshot == 'event: snapshot\ndata: {"total_todos": 1, "completed_todos": 0}\n\n'
+    event = json.loads(delta.split('data: ', 1)[1])
+    assert event['stats'] == {'total_todos': 5}
+    assert [change['id'] for change in event['changes']] == [0, 1, 2, 3, 4]
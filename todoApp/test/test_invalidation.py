@@ -0,0 +1,24 @@
+import time
+from sqlalchemy import create_engine
+from ..invalidation import InvalidationBus
+
+
+def test_sqlite_polling_delivers_remote_invalidations(tmp_path, monkeypatch):
+    monkeypatch.setattr('todoApp.invalidation.POLL_INTERVAL', 0.05)
+    engine = create_engine(f"sqlite:///{tmp_path / 'bus.db'}")
+    writer, reader = InvalidationBus(), InvalidationBus()
+    received = []
+    reader.subscribe(received.append)
+    writer.start(engine)
+    reader.start(engine)
+    try:
+        writer.publish('todos:1', 'todo:1:7')
+        reader.publish('todos:2')  # a worker ignores its own messages
+        deadline = time.monotonic() + 2
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.1)
+    finally:
+        writer.stop()
+        reader.stop()
+    assert received == [['todos:1', 'todo:1:7']]
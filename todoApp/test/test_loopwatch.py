@@ -0,0 +1,27 @@
+import asyncio
+import time
+from ..loopwatch import LoopWatchdog
+
+
+def blocking_call():
+    time.sleep(0.3)
+
+
+def test_watchdog_measures_lag_and_names_the_blocking_call():
+    async def scenario():
+        watchdog = LoopWatchdog(interval=0.02, threshold=0.1)
+        watchdog.start()
+        await asyncio.sleep(0.1)
+        blocking_call()
+        await asyncio.sleep(0.1)
+        await watchdog.stop()
+        return watchdog.report()
+
+    report = asyncio.run(scenario())
+    assert report['samples'] > 0
+    assert report['max_lag_ms'] >= 200
+    assert report['histogram_ms']['+Inf'] == report['samples']
+    [stall] = report['stalls']
+    assert stall['site'].startswith('blocking_call (test/test_loopwatch.py:')
+    assert stall['lag_ms'] >= 200
+    assert report['top_sites'] == [{'site': stall['site'], 'stalls': 1}]
@@ -10,3 +10,15 @@ def test_return_health_check():
     assert response.status_code == status.HTTP_200_OK
     assert response.json() == {'status': 'Healthy'}
 
+
+
+def test_page_shells_are_cached_and_revalidated_with_etag():
+    response = client.get("/auth/login-page")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith('text/html')
+    etag = response.headers['etag']
+
+    assert client.get("/auth/login-page").content == response.content
+    response = client.get("/auth/login-page", headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers['etag'] == etag
@@ -0,0 +1,35 @@
+from fastapi import status
+from ..metrics import Metrics, merge, render
+from .utils import *
+
+
+def test_metrics_endpoint_reports_route_templates():
+    client.get("/healthy")
+    client.get("/todos/todo/999999")
+
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    body = response.text
+    assert 'todoapp_http_requests_total{method="GET",route="/healthy",status="200"}' in body
+    assert 'route="/todos/todo/{todo_id}"' in body
+    assert 'todoapp_http_request_duration_seconds_bucket{method="GET",route="/healthy",le="+Inf"}' in body
+    assert 'todoapp_cache_hits_total{cache="todos"}' in body
+
+
+def test_worker_snapshots_merge_and_stale_gauges_are_dropped():
+    first, second = Metrics(buckets=(0.1, 1.0)), Metrics(buckets=(0.1, 1.0))
+    first.observe('GET', '/todos/', 200, 0.05)
+    second.observe('GET', '/todos/', 200, 0.5)
+    second.observe('GET', '/todos/', 200, 3.0)
+    first.in_progress['GET'] = 1
+    second.in_progress['GET'] = 4
+    stale = second.snapshot()
+    stale['written'] -= 60
+
+    text = render(merge([first.snapshot(), stale], max_age=15))
+    assert 'todoapp_http_requests_total{method="GET",route="/todos/",status="200"} 3' in text
+    assert 'todoapp_http_request_duration_seconds_bucket{method="GET",route="/todos/",le="0.1"} 1' in text
+    assert 'todoapp_http_request_duration_seconds_bucket{method="GET",route="/todos/",le="1.0"} 2' in text
+    assert 'todoapp_http_request_duration_seconds_bucket{method="GET",route="/todos/",le="+Inf"} 3' in text
+    assert 'todoapp_http_requests_in_progress{method="GET"} 1' in text
@@ -0,0 +1,48 @@
+import time
+from datetime import timedelta
+from typing import Annotated
+from fastapi import Depends, FastAPI, status
+from fastapi.testclient import TestClient
+from .. import profiling
+from ..profiling import Profiler, ProfilingMiddleware
+from ..routers.auth import create_access_token, get_current_user
+
+app = FastAPI()
+app.add_middleware(ProfilingMiddleware)
+
+
+@app.get('/slow')
+def slow(user: Annotated[dict, Depends(get_current_user)]):
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    return user
+
+
+def bearer(role):
+    return {'Authorization': f"Bearer {create_access_token('someone', 1, role, timedelta(minutes=5))}"}
+
+
+def test_admin_profiles_are_folded_stacks_and_rate_limited(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'profiler', Profiler(str(tmp_path)))
+    monkeypatch.setattr(profiling, 'PROFILE_MAX_PER_HOUR', 1)
+    monkeypatch.setattr(profiling, 'PROFILE_INTERVAL_MS', 1)
+    client = TestClient(app)
+
+    response = client.get('/slow', params={'profile': '1'}, headers=bearer('admin'))
+    assert response.status_code == status.HTTP_200_OK
+    name = response.headers['x-profile']
+    assert profiling.profiler.list() == [name]
+    lines = (tmp_path / name).read_text().splitlines()
+    assert any('slow (test/test_profiling.py:' in line for line in lines)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+    assert client.get('/slow', headers={'X-Profile': '1', **bearer('admin')}).headers['x-profile'] == 'rate-limited'
+
+
+def test_profile_flag_is_ignored_for_non_admins(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'profiler', Profiler(str(tmp_path)))
+    response = TestClient(app).get('/slow', headers={'X-Profile': '1', **bearer('user')})
+    assert response.status_code == status.HTTP_200_OK
+    assert 'x-profile' not in response.headers
+    assert profiling.profiler.list() == []
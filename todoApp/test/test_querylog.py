@@ -0,0 +1,57 @@
+import logging
+from sqlalchemy import text
+from .. import querylog
+from ..querylog import RequestQueries, normalize_sql
+from .utils import *
+
+
+def test_normalize_sql_strips_values_and_collapses_lists():
+    assert normalize_sql("SELECT *\n  FROM todos WHERE owner_id = ? AND title = 'x''y' AND id IN (?, ?, ?) LIMIT 10") == \
+        "SELECT * FROM todos WHERE owner_id = ? AND title = ? AND id IN (?, ...) LIMIT ?"
+    assert normalize_sql("SELECT users.id FROM users WHERE users.id = %(id_1)s") == \
+        "SELECT users.id FROM users WHERE users.id = ?"
+
+
+def test_slow_queries_and_repeats_are_logged(monkeypatch, caplog):
+    monkeypatch.setattr(querylog, 'SLOW_QUERY_MS', 0.0)
+    queries = RequestQueries({'method': 'GET', 'path': '/todos/'})
+    token = querylog._queries.set(queries)
+    try:
+        with caplog.at_level(logging.WARNING, logger='todoApp.querylog'), engine.connect() as conn:
+            for todo_id in range(querylog.N_PLUS_ONE_THRESHOLD):
+                conn.execute(text('SELECT id FROM todos WHERE id = :id'), {'id': todo_id})
+            queries.report()
+    finally:
+        querylog._queries.reset(token)
+
+    assert queries.count == querylog.N_PLUS_ONE_THRESHOLD
+    assert 'Slow query' in caplog.text and 'SELECT id FROM todos WHERE id = ?' in caplog.text
+    assert 'Possible N+1 on GET unmatched' in caplog.text
+
+
+def test_one_cursor_hook_feeds_timing_querylog_and_tracing():
+    from .. import timing, tracing
+
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        # Nothing is watching: no per-statement state is kept.
+        assert not conn.info.get('statements')
+
+        queries = RequestQueries({'method': 'GET', 'path': '/todos/'})
+        timings = timing.Timings()
+        spans = []
+        root = tracing.Span('GET /todos/', 'a' * 32, None, spans)
+        tokens = (querylog._queries.set(queries), timing._timings.set(timings), tracing._current.set(root))
+        try:
+            conn.execute(text('SELECT 2'))
+        finally:
+            tracing._current.reset(tokens[2])
+            timing._timings.reset(tokens[1])
+            querylog._queries.reset(tokens[0])
+        assert not conn.info['statements']
+
+    seconds, count = timings.phases['db']
+    query = spans[1]
+    assert (queries.count, count, query.name) == (1, 1, 'db.query')
+    assert queries.seconds == seconds
+    assert query.end_ns - query.start_ns == int(seconds * 1e9)
@@ -0,0 +1,295 @@
+import asyncio
+from datetime import timedelta
+from fastapi import status
+from ..database import get_db
+from ..events import publish_todo_event, todo_events
+from ..models import Todos
+from ..routers import todos as todos_router
+from ..routers.auth import create_access_token, get_current_user
+from .. import timing
+from .utils import *
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def test_read_all_authenticated(test_todo):
+    response = client.get("/todos/")
+    assert response.status_code == status.HTTP_200_OK
+    assert [todo['title'] for todo in response.json()] == ['Learn to code!']
+
+
+def test_server_timing_breaks_down_db_and_encode(test_todo, monkeypatch):
+    monkeypatch.setattr(timing, 'SERVER_TIMING', True)
+    invalidate_todos(test_todo.owner_id)
+    response = client.get("/todos/")
+    assert response.status_code == status.HTTP_200_OK
+    phases = dict(part.split(';', 1) for part in response.headers['server-timing'].split(', '))
+    assert {'db', 'encode', 'total'} <= phases.keys()
+    assert 'queries"' in phases['db'] or 'query"' in phases['db']
+
+    monkeypatch.setattr(timing, 'SERVER_TIMING', False)
+    assert 'server-timing' not in client.get("/todos/").headers
+
+
+def test_search_ranks_and_scopes_to_owner(test_todo):
+    db = TestingSessionLocal()
+    db.add_all([
+        Todos(title="Buy groceries", description="milk and code snippets", priority=1,
+              complete=False, owner_id=1),
+        Todos(title="Code review", description="review the code for the code sprint", priority=2,
+              complete=False, owner_id=1),
+        Todos(title="Someone else's code", description="not visible", priority=2,
+              complete=False, owner_id=2),
+    ])
+    db.commit()
+
+    response = client.get("/todos/search", params={'q': 'code'})
+    assert response.status_code == status.HTTP_200_OK
+    titles = [todo['title'] for todo in response.json()]
+    assert titles[0] == 'Code review'
+    assert "Someone else's code" not in titles
+    assert len(titles) == 3
+
+    response = client.get("/todos/search", params={'q': 'code', 'limit': 1, 'offset': 1})
+    assert len(response.json()) == 1
+
+
+def test_search_follows_updates_and_deletes(test_todo):
+    db = TestingSessionLocal()
+    todo = db.query(Todos).filter(Todos.id == test_todo.id).first()
+    todo.title = "Practice guitar"
+    db.commit()
+
+    assert client.get("/todos/search", params={'q': 'guitar'}).json()[0]['id'] == test_todo.id
+
+    db.delete(todo)
+    db.commit()
+    assert client.get("/todos/search", params={'q': 'guitar'}).json() == []
+
+
+def test_suggest_prefix_and_invalidation(test_todo):
+    response = client.get("/todos/suggest", params={'q': 'lea'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == ['Learn to code!']
+
+    client.post("/todos/todo", json={'title': 'Learn piano', 'description': 'scales first',
+                                     'priority': 2, 'complete': False})
+    assert sorted(client.get("/todos/suggest", params={'q': 'lea'}).json()) == ['Learn piano', 'Learn to code!']
+    assert client.get("/todos/suggest", params={'q': 'zzz'}).json() == []
+
+
+def test_update_todo_compare_and_swap(test_todo):
+    payload = {'title': 'Change the title', 'description': 'Need to learn everyday!',
+               'priority': 5, 'complete': False, 'version': 1}
+    response = client.put(f"/todos/todo/{test_todo.id}", json=payload)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert response.headers['etag'] == '"2"'
+    assert client.get(f"/todos/todo/{test_todo.id}").json()['version'] == 2
+
+    # A second tab still holding version 1 must not clobber the first write.
+    payload['title'] = 'Stale tab title'
+    response = client.put(f"/todos/todo/{test_todo.id}", json=payload)
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert client.get(f"/todos/todo/{test_todo.id}").json()['title'] == 'Change the title'
+
+    del payload['version']
+    response = client.put(f"/todos/todo/{test_todo.id}", json=payload, headers={'If-Match': '"2"'})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = client.put("/todos/todo/999", json=payload, headers={'If-Match': '"1"'})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_writes_without_a_version_are_rejected(test_todo):
+    payload = {'title': 'Blind overwrite', 'description': 'Need to learn everyday!',
+               'priority': 5, 'complete': False}
+    response = client.put(f"/todos/todo/{test_todo.id}", json=payload)
+    assert response.status_code == status.HTTP_428_PRECONDITION_REQUIRED
+    response = client.patch(f"/todos/todo/{test_todo.id}", json={'priority': 1, 'version': None})
+    assert response.status_code == status.HTTP_428_PRECONDITION_REQUIRED
+    assert client.get(f"/todos/todo/{test_todo.id}").json()['title'] == 'Learn to code!'
+
+    response = client.put(f"/todos/todo/{test_todo.id}", json=payload, headers={'If-Match': '*'})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+def test_toggle_bumps_version(test_todo):
+    response = client.put(f"/todos/todo/{test_todo.id}/toggle")
+    assert response.json() == {'id': test_todo.id, 'complete': True, 'version': 2}
+
+
+def test_patch_writes_only_supplied_fields(test_todo):
+    with capture_queries() as statements:
+        response = client.patch(f"/todos/todo/{test_todo.id}", json={'priority': 2, 'version': 1})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    [todo_update] = [s for s in statements if s.startswith('UPDATE todos ')]
+    assert todo_update.startswith('UPDATE todos SET priority=?, version=(todos.version + ?), seq=?, updated_at=? WHERE')
+    todo = client.get(f"/todos/todo/{test_todo.id}").json()
+    assert todo['priority'] == 2
+    assert todo['title'] == 'Learn to code!'
+    assert todo['version'] == 2
+
+    response = client.patch(f"/todos/todo/{test_todo.id}", json={'complete': True, 'version': 1})
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    response = client.patch(f"/todos/todo/{test_todo.id}", json={})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.patch(f"/todos/todo/{test_todo.id}", json={'title': None, 'version': 2})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_list_cache_is_invalidated_by_writes(test_todo):
+    from ..cache import todo_cache
+    todo_cache.local.clear()
+
+    assert len(client.get("/todos/").json()) == 1
+    misses = todo_cache.local.misses
+    assert len(client.get("/todos/").json()) == 1
+    assert todo_cache.local.misses == misses
+
+    client.post("/todos/todo", json={'title': 'Second todo', 'description': 'another one',
+                                     'priority': 1, 'complete': False})
+    assert len(client.get("/todos/").json()) == 2
+
+    client.put(f"/todos/todo/{test_todo.id}/toggle")
+    assert client.get(f"/todos/todo/{test_todo.id}").json()['complete'] is True
+
+    client.delete(f"/todos/todo/{test_todo.id}")
+    assert len(client.get("/todos/").json()) == 1
+    assert client.get(f"/todos/todo/{test_todo.id}").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_list_etag_is_scoped_to_the_user(test_todo):
+    etag = client.get("/todos/").headers['etag']
+    app.dependency_overrides[get_current_user] = lambda: {'username': 'other', 'id': 2, 'user_role': 'user'}
+    try:
+        response = client.get("/todos/", headers={'If-None-Match': etag})
+    finally:
+        app.dependency_overrides[get_current_user] = override_get_current_user
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+    assert response.headers['etag'] != etag
+
+
+def test_conditional_get_returns_304_until_a_write(test_todo):
+    response = client.get("/todos/")
+    etag = response.headers['etag']
+    assert client.get("/todos/", headers={'If-None-Match': etag}).status_code == status.HTTP_304_NOT_MODIFIED
+
+    response = client.get(f"/todos/todo/{test_todo.id}")
+    todo_etag = response.headers['etag']
+    assert todo_etag == '"1"'
+    response = client.get(f"/todos/todo/{test_todo.id}", headers={'If-None-Match': todo_etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    client.patch(f"/todos/todo/{test_todo.id}", json={'priority': 1}, headers={'If-Match': todo_etag})
+    assert client.get("/todos/", headers={'If-None-Match': etag}).status_code == status.HTTP_200_OK
+    response = client.get(f"/todos/todo/{test_todo.id}", headers={'If-None-Match': todo_etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['etag'] == '"2"'
+
+
+def test_msgpack_is_negotiated_from_accept(test_todo):
+    import msgpack
+    response = client.get("/todos/", headers={'Accept': 'application/msgpack'})
+    assert response.headers['content-type'] == 'application/msgpack'
+    assert response.headers['vary'] == 'Accept, Authorization, Cookie'
+    assert [todo['title'] for todo in msgpack.unpackb(response.content)] == ['Learn to code!']
+
+    json_etag = client.get("/todos/").headers['etag']
+    assert response.headers['etag'] != json_etag
+
+    response = client.get(f"/todos/todo/{test_todo.id}",
+                          headers={'Accept': 'application/json;q=0.5, application/msgpack'})
+    assert msgpack.unpackb(response.content)['id'] == test_todo.id
+
+    response = client.get(f"/todos/todo/{test_todo.id}", headers={'Accept': 'text/html, */*;q=0.8'})
+    assert response.headers['content-type'] == 'application/json'
+
+
+def test_todo_page_renders_the_list_server_side(test_todo):
+    del app.dependency_overrides[get_current_user]
+    try:
+        response = client.get("/todos/todo-page", follow_redirects=False)
+        assert response.status_code == status.HTTP_302_FOUND
+        assert response.headers['location'] == '/auth/login-page'
+        # API routes still answer 401.
+        assert client.get("/todos/", follow_redirects=False).status_code == status.HTTP_401_UNAUTHORIZED
+
+        token = create_access_token('codingwithtest', test_todo.owner_id, 'admin', timedelta(minutes=5))
+        client.cookies.set('access_token', token)
+        response = client.get("/todos/todo-page")
+    finally:
+        client.cookies.clear()
+        app.dependency_overrides[get_current_user] = override_get_current_user
+    assert response.status_code == status.HTTP_200_OK
+    assert 'Learn to code!' in response.text
+    assert f'data-id="{test_todo.id}"' in response.text
+    assert '"complete": true' in response.text
+
+
+def test_changes_returns_only_what_changed_since_seq(test_todo):
+    seq = client.get("/todos/changes", params={'since': 0}).json()['seq']
+    assert client.get("/todos/changes", params={'since': seq}).json() == {
+        'seq': seq, 'resync': False, 'todos': [], 'deleted': []}
+
+    created = client.post("/todos/todo", json={
+        'title': 'New todo!', 'description': 'Fresh one', 'priority': 2, 'complete': False}).json()
+    client.put(f"/todos/todo/{test_todo.id}/toggle")
+    changes = client.get("/todos/changes", params={'since': seq}).json()
+    assert changes['resync'] is False
+    assert sorted(todo['id'] for todo in changes['todos']) == sorted([test_todo.id, created['id']])
+    assert changes['deleted'] == []
+
+    seq = changes['seq']
+    client.delete(f"/todos/todo/{created['id']}")
+    changes = client.get("/todos/changes", params={'since': seq}).json()
+    assert changes['todos'] == []
+    assert changes['deleted'] == [created['id']]
+    assert changes['seq'] == seq + 1
+
+    assert client.get("/todos/changes", params={'since': seq + 100}).json()['resync'] is True
+
+
+def test_stream_requires_auth_and_catches_up_from_last_event_id(test_todo):
+    del app.dependency_overrides[get_current_user]
+    try:
+        assert client.get("/todos/stream").status_code == status.HTTP_401_UNAUTHORIZED
+    finally:
+        app.dependency_overrides[get_current_user] = override_get_current_user
+
+    since = client.get("/todos/changes", params={'since': 0}).json()['seq']
+    client.patch(f"/todos/todo/{test_todo.id}", json={'priority': 2, 'version': 1})
+    client.post("/todos/todo", json={'title': 'Short lived', 'description': 'Deleted soon',
+                                     'priority': 1, 'complete': False})
+    created = client.get("/todos/changes", params={'since': since + 1}).json()['todos'][0]['id']
+    client.delete(f"/todos/todo/{created}")
+
+    # TestClient buffers whole bodies, so read the endless stream straight from the endpoint.
+    async def run(last_event_id):
+        db = TestingSessionLocal()
+        response = await todos_router.stream({'id': 1}, db, last_event_id)
+        db.close()
+        chunks = [await response.body_iterator.__anext__()]
+        publish_todo_event(1, 'updated', test_todo.id, since + 1)
+        publish_todo_event(1, 'created', 42, since + 4)
+        chunks.append(await asyncio.wait_for(response.body_iterator.__anext__(), 2))
+        await response.body_iterator.aclose()
+        return response, chunks, todo_events.hub.stats()
+
+    response, (first, live), stats = asyncio.run(run(since))
+    assert response.media_type == 'text/event-stream'
+    assert response.headers['cache-control'] == 'no-cache'
+    assert first == (
+        'retry: 5000\n\n'
+        f'id: {since + 1}\nevent: updated\ndata: {{"type":"updated","id":{test_todo.id},"seq":{since + 1}}}\n\n'
+        f'id: {since + 3}\nevent: deleted\ndata: {{"type":"deleted","id":{created},"seq":{since + 3}}}\n\n'
+    )
+    # The already-replayed update is skipped; only the newer event goes out live.
+    assert live.startswith(f'id: {since + 4}\nevent: created\n')
+    assert stats == {'users': 0, 'streams': 0}
+
+    _, (first, _), _ = asyncio.run(run(since + 100))
+    assert first == 'retry: 5000\n\nevent: resync\ndata: {"type":"resync"}\n\n'
@@ -0,0 +1,76 @@
+from fastapi import status
+from ..database import get_db
+from ..routers.auth import get_current_user
+from .. import tracing
+from ..tracing import Tracer, to_otlp
+from .utils import *
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+class CollectingExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append(spans)
+
+    def shutdown(self):
+        pass
+
+
+def test_sampled_request_is_exported_as_a_span_tree(test_todo, monkeypatch):
+    exporter = CollectingExporter()
+    monkeypatch.setattr(tracing, 'tracer', Tracer(exporter, sample_rate=1.0))
+    invalidate_todos(test_todo.owner_id)
+
+    response = client.get("/todos/")
+    assert response.status_code == status.HTTP_200_OK
+    [spans] = exporter.traces
+    root = spans[0]
+    assert root['name'] == 'GET /todos/' and root['parent_id'] is None
+    assert response.headers['x-trace-id'] == root['trace_id']
+    assert root['attributes']['http.status_code'] == 200
+    by_name = {span['name']: span for span in spans}
+    assert by_name['todos.list']['parent_id'] == root['span_id']
+    assert by_name['todos.list']['attributes']['cache.hit'] is False
+    assert by_name['encode']['parent_id'] == root['span_id']
+    queries = [span for span in spans if span['name'] == 'db.query']
+    assert queries and all(span['trace_id'] == root['trace_id'] for span in queries)
+    assert any(span['parent_id'] == by_name['todos.list']['span_id'] for span in queries)
+
+    otlp = to_otlp(spans)['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert otlp[0]['traceId'] == root['trace_id'] and otlp[0]['kind'] == 2
+    assert 'parentSpanId' not in otlp[0]
+
+
+def test_unsampled_requests_and_parent_decisions(test_todo, monkeypatch):
+    exporter = CollectingExporter()
+    monkeypatch.setattr(tracing, 'tracer', Tracer(exporter, sample_rate=0.0))
+    response = client.get("/todos/")
+    assert 'x-trace-id' not in response.headers
+    assert exporter.traces == []
+
+    trace_id, parent_id = 'ab' * 16, 'cd' * 8
+    client.get("/todos/", headers={'traceparent': f'00-{trace_id}-{parent_id}-01'})
+    [spans] = exporter.traces
+    assert spans[0]['trace_id'] == trace_id and spans[0]['parent_id'] == parent_id
+
+    client.get("/todos/", headers={'traceparent': f'00-{trace_id}-{parent_id}-00'})
+    assert len(exporter.traces) == 1
+
+
+def test_malformed_traceparent_is_ignored_and_forced_sampling_is_capped(test_todo, monkeypatch):
+    exporter = CollectingExporter()
+    monkeypatch.setattr(tracing, 'tracer', Tracer(exporter, sample_rate=0.0, parent_max_per_second=2))
+    for header in (f"00-{'ab' * 16}-{'cd' * 8}-zz", f"00-{'<' * 32}-{'cd' * 8}-01", 'garbage'):
+        response = client.get("/todos/", headers={'traceparent': header})
+        assert response.status_code == status.HTTP_200_OK
+        assert 'x-trace-id' not in response.headers
+
+    for _ in range(5):
+        client.get("/todos/", headers={'traceparent': f"00-{'ab' * 16}-{'cd' * 8}-01"})
+    # Two per second; the loop may straddle a second boundary.
+    assert 2 <= len(exporter.traces) <= 4
+
@@ -0,0 +1,26 @@
+from fastapi import status
+from ..routers.auth import get_current_user
+from ..routers.users import get_db
+from .utils import *
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def test_return_user(test_user):
+    response = client.get("/users/")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['username'] == 'codingwithtest'
+    assert response.json()['email'] == 'codingwithtest@email.com'
+
+
+def test_profile_etag_changes_with_profile(test_user):
+    etag = client.get("/users/").headers['etag']
+    assert client.get("/users/", headers={'If-None-Match': etag}).status_code == status.HTTP_304_NOT_MODIFIED
+
+    response = client.put("/users/phonenumber/2222222222")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = client.get("/users/", headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['phone_number'] == '2222222222'
@@ -0,0 +1,90 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from contextlib import contextmanager
+from fastapi.testclient import TestClient
+import pytest
+from ..database import Base
+from ..main import app
+from ..models import Todos, Users
+from ..search import ensure_search_index
+from ..cache import invalidate_todos
+from ..querylog import capture_queries
+
+SQLALCHEMY_DATABASE_URL = "sqlite://"
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+Base.metadata.create_all(bind=engine)
+ensure_search_index(engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def override_get_current_user():
+    return {'username': 'codingwithtest', 'id': 1, 'user_role': 'admin'}
+
+
+client = TestClient(app)
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """Fail if the block runs more than limit SQL statements; the message lists them."""
+    with capture_queries() as statements:
+        yield statements
+    assert len(statements) <= limit, (
+        f'{len(statements)} queries, budget {limit}:\n' + '\n'.join(statements)
+    )
+
+
+@pytest.fixture
+def test_user():
+    user = Users(
+        username="codingwithtest",
+        email="codingwithtest@email.com",
+        first_name="Test",
+        last_name="User",
+        hashed_password="not-a-real-hash",
+        role="admin",
+        phone_number="(111)-111-1111",
+        address="",
+    )
+    db = TestingSessionLocal()
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    yield user
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM todos;"))
+        connection.execute(text("DELETE FROM todo_tombstones;"))
+        connection.execute(text("DELETE FROM users;"))
+    invalidate_todos(user.id)
+
+
+@pytest.fixture
+def test_todo(test_user):
+    todo = Todos(
+        title="Learn to code!",
+        description="Need to learn everyday!",
+        priority=5,
+        complete=False,
+        owner_id=test_user.id,
+    )
+    db = TestingSessionLocal()
+    db.add(todo)
+    db.commit()
+    db.refresh(todo)
+    yield todo
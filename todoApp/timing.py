@@ -0,0 +1,114 @@
+"""
+Server-Timing breakdown of where a request spent its time.
+
+With SERVER_TIMING=1, ServerTimingMiddleware gives each request a Timings
+record in a context variable and sends the totals back as a Server-Timing
+header, which browser devtools and load-test reports show per phase:
+
+* auth: JWT decoding (decode_access_token)
+* session: checking a database connection out of the pool (get_db)
+* db: time inside cursor.execute, with the query count
+* encode: rendering the response body (NegotiatedResponse.render)
+* total: the whole request, up to the response headers
+
+Sync dependencies and endpoints run in the threadpool with a copy of the
+request's context, which shares the same Timings object, so their phases are
+counted too. With the setting off, each instrumented point costs one context
+variable lookup.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from todoApp.dbhooks import on_statement
+from todoApp.tracing import current_span, span
+
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+
+
+class Timings:
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, name: str, seconds: float):
+        phase = self.phases.get(name)
+        if phase is None:
+            self.phases[name] = [seconds, 1]
+        else:
+            phase[0] += seconds
+            phase[1] += 1
+
+    def header(self, total: float):
+        parts = []
+        for name, (seconds, count) in self.phases.items():
+            part = f'{name};dur={seconds * 1000:.2f}'
+            if name == 'db':
+                part += f';desc="{count} {"query" if count == 1 else "queries"}"'
+            parts.append(part)
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+
+_timings: ContextVar[Timings | None] = ContextVar('server_timings', default=None)
+
+
+def current_timings():
+    return _timings.get()
+
+
+@contextmanager
+def phase(name: str):
+    """Count the enclosed block towards name, when the request is being timed."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def checkout(db):
+    """Check the session's connection out now, so the wait shows up as the session phase and span."""
+    if _timings.get() is not None or current_span() is not None:
+        with phase('session'), span('db.checkout'):
+            db.connection()
+
+
+@on_statement
+def _watch_statement(conn, statement):
+    timings = _timings.get()
+    if timings is None:
+        return None
+
+    def finished(statement, seconds, error):
+        if error is None:
+            timings.add('db', seconds)
+    return finished
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not SERVER_TIMING:
+            await self.app(scope, receive, send)
+            return
+        timings = Timings()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                header = timings.header(time.perf_counter() - started)
+                message['headers'] = [*message.get('headers', []), (b'server-timing', header.encode('latin-1'))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timings.reset(token)
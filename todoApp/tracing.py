@@ -0,0 +1,428 @@
+"""
+In-process request tracing.
+
+TracingMiddleware decides once per request whether to trace it. The request
+is traced when the incoming W3C `traceparent` header is marked sampled, or
+with probability TRACE_SAMPLE_RATE. For a sampled request it opens a root
+span, and span() calls made anywhere below it become children:
+
+    route → auth.jwt → db.checkout → db.query (one per statement) → encode
+                                                 → template.render
+
+A `traceparent` that is not well formed is ignored. Sampling forced by a
+sampled parent is capped at TRACE_PARENT_MAX_PER_SECOND per worker, so
+clients cannot turn on 100% tracing; past the cap the request falls back to
+TRACE_SAMPLE_RATE, keeping its parent's trace id if sampled.
+
+An unsampled request carries no trace, so span() returns a shared no-op
+after one context variable lookup. db.query spans come from the shared
+cursor hook (dbhooks.py) and cost the same single lookup when off.
+
+When the root span ends, the whole trace is queued for the exporter chosen by
+TRACE_EXPORTER. Every exporter writes from its own thread, never the event
+loop, and drops traces when its queue is full:
+
+* none (default): tracing is off and nothing is sampled.
+* console: one indented tree per trace on the `todoApp.tracing` logger.
+* file: one JSON line per trace, appended to TRACE_FILE.
+* otlp: OTLP/HTTP JSON, batched by a background thread and posted to
+  TRACE_OTLP_ENDPOINT, for a collector, Jaeger or Tempo.
+
+Sampled responses carry an X-Trace-Id header so a slow response can be
+matched to its trace.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import re
+import secrets
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from urllib import request as urlrequest
+
+from todoApp.dbhooks import on_statement
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', 'none')
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_FILE = os.environ.get('TRACE_FILE', os.path.join(tempfile.gettempdir(), 'todoapp-traces.jsonl'))
+TRACE_OTLP_ENDPOINT = os.environ.get('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+TRACE_SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'todoapp')
+TRACE_PARENT_MAX_PER_SECOND = int(os.environ.get('TRACE_PARENT_MAX_PER_SECOND', '10'))
+# SQL is recorded as the statement text, never the bound parameters.
+MAX_STATEMENT_LENGTH = 2000
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'attributes',
+                 'start_ns', 'end_ns', 'error', 'spans')
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, spans: list,
+                 attributes: dict | None = None, kind: str = 'internal'):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self.spans = spans
+        spans.append(self)
+
+    def child(self, name: str, attributes: dict | None = None):
+        return Span(name, self.trace_id, self.span_id, self.spans, attributes)
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, error: BaseException | None = None, seconds: float | None = None):
+        """End now, or seconds after the span started when the caller measured it."""
+        if self.end_ns is None:
+            self.end_ns = time.time_ns() if seconds is None else self.start_ns + int(seconds * 1e9)
+            if error is not None:
+                self.error = f'{type(error).__name__}: {error}'
+
+    def as_dict(self):
+        end_ns = self.end_ns or time.time_ns()
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start_ns': self.start_ns,
+            'end_ns': end_ns,
+            'duration_ms': round((end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+_current: ContextVar[Span | None] = ContextVar('current_span', default=None)
+
+
+def current_span():
+    return _current.get()
+
+
+class _SpanScope:
+    __slots__ = ('span', 'token')
+
+    def __init__(self, span: Span):
+        self.span = span
+        self.token = None
+
+    def __enter__(self):
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        self.span.end(exc)
+        return False
+
+
+class _NoopScope:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopScope()
+
+
+def span(name: str, **attributes):
+    """Context manager for a child of the current span; a no-op when the request is not traced."""
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    return _SpanScope(parent.child(name, attributes))
+
+
+def start_span(name: str, **attributes):
+    """A child span the caller ends itself (for work that outlives the block, like streaming), or None."""
+    parent = _current.get()
+    return parent.child(name, attributes) if parent is not None else None
+
+
+@on_statement
+def _watch_statement(conn, statement):
+    parent = _current.get()
+    if parent is None:
+        return None
+    query = parent.child('db.query', {
+        'db.system': conn.dialect.name,
+        'db.statement': statement[:MAX_STATEMENT_LENGTH],
+    })
+    return lambda statement, seconds, error: query.end(error, seconds)
+
+
+# --- exporters ---
+
+class QueuedExporter:
+    """Hands traces to a writer thread; export() never blocks the caller."""
+
+    def __init__(self, max_queue: int = 1024):
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[dict]):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while (spans := self._queue.get()) is not None:
+            try:
+                self.write(spans)
+            except Exception:
+                logger.exception('Trace export failed')
+
+    def write(self, spans: list[dict]):
+        raise NotImplementedError
+
+    def shutdown(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class ConsoleExporter(QueuedExporter):
+    def write(self, spans: list[dict]):
+        depth = {None: -1}
+        lines = []
+        for span in sorted(spans, key=lambda s: s['start_ns']):
+            depth[span['span_id']] = depth.get(span['parent_id'], -1) + 1
+            error = f"  !! {span['error']}" if span['error'] else ''
+            lines.append(f"{'  ' * depth[span['span_id']]}{span['name']} {span['duration_ms']:.2f}ms{error}")
+        logger.info('trace %s\n%s', spans[0]['trace_id'], '\n'.join(lines))
+
+
+class JsonFileExporter(QueuedExporter):
+    def __init__(self, path: str = TRACE_FILE):
+        super().__init__()
+        self.path = path
+
+    def write(self, spans: list[dict]):
+        line = json.dumps({'trace_id': spans[0]['trace_id'], 'spans': spans}, separators=(',', ':'), default=str)
+        with open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(spans: list[dict], service_name: str = TRACE_SERVICE_NAME):
+    """OTLP/JSON ExportTraceServiceRequest for spans."""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service_name}}]},
+        'scopeSpans': [{
+            'scope': {'name': __name__},
+            'spans': [{
+                'traceId': span['trace_id'],
+                'spanId': span['span_id'],
+                **({'parentSpanId': span['parent_id']} if span['parent_id'] else {}),
+                'name': span['name'],
+                'kind': 2 if span['kind'] == 'server' else 1,
+                'startTimeUnixNano': str(span['start_ns']),
+                'endTimeUnixNano': str(span['end_ns']),
+                'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in span['attributes'].items()],
+                'status': {'code': 2, 'message': span['error']} if span['error'] else {},
+            } for span in spans],
+        }],
+    }]}
+
+
+class OTLPExporter:
+    """Posts batches of spans as OTLP/HTTP JSON from a background thread; drops when the queue is full."""
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, max_queue: int = 2048,
+                 batch_size: int = 512, interval: float = 2.0):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[dict]):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='otlp-exporter', daemon=True)
+                    self._thread.start()
+        for span in spans:
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    self._post(batch)
+                    return
+                batch.append(span)
+            self._post(batch)
+
+    def _post(self, batch: list[dict]):
+        if not batch:
+            return
+        body = json.dumps(to_otlp(batch), default=str).encode()
+        req = urlrequest.Request(self.endpoint, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urlrequest.urlopen(req, timeout=5) as response:
+                response.read()
+        except Exception:
+            logger.warning('Failed to export %d spans to %s', len(batch), self.endpoint, exc_info=True)
+
+    def shutdown(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+EXPORTERS = {
+    'console': ConsoleExporter,
+    'file': JsonFileExporter,
+    'otlp': OTLPExporter,
+}
+
+
+TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+def parse_traceparent(header: str | None):
+    """(trace_id, parent_id, sampled) from a W3C traceparent header, or None if it is malformed."""
+    match = TRACEPARENT.match(header.strip()) if header else None
+    if match is None:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+class Tracer:
+    def __init__(self, exporter=None, sample_rate: float = TRACE_SAMPLE_RATE,
+                 parent_max_per_second: int = TRACE_PARENT_MAX_PER_SECOND):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.parent_max_per_second = parent_max_per_second
+        self._window = 0
+        self._forced = 0
+
+    def _allow_forced(self):
+        window = int(time.monotonic())
+        if window != self._window:
+            self._window, self._forced = window, 0
+        if self._forced >= self.parent_max_per_second:
+            return False
+        self._forced += 1
+        return True
+
+    def start_trace(self, name: str, traceparent: str | None):
+        """The root span for a request, or None when it is not sampled."""
+        if self.exporter is None:
+            return None
+        trace_id, parent_id = None, None
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+            if not sampled:
+                return None
+        if parent is None or not self._allow_forced():
+            if random.random() >= self.sample_rate:
+                return None
+        return Span(name, trace_id or secrets.token_hex(16), parent_id, [], kind='server')
+
+    def finish(self, root: Span):
+        try:
+            self.exporter.export([span.as_dict() for span in root.spans])
+        except Exception:
+            logger.exception('Trace export failed')
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+tracer = Tracer(EXPORTERS[TRACE_EXPORTER]() if TRACE_EXPORTER in EXPORTERS else None)
+
+
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or tracer.exporter is None:
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for name, value in scope['headers']:
+            if name == b'traceparent':
+                traceparent = value.decode('latin-1')
+                break
+        root = tracer.start_trace(f"{scope['method']} {scope['path']}", traceparent)
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+        root.attributes.update({'http.method': scope['method'], 'http.target': scope['path']})
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                root.set('http.status_code', message['status'])
+                message['headers'] = [*message.get('headers', []), (b'x-trace-id', root.trace_id.encode())]
+            await send(message)
+
+        token = _current.set(root)
+        error = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            _current.reset(token)
+            route = scope.get('route')
+            if route is not None:
+                root.name = f"{scope['method']} {route.path}"
+                root.set('http.route', route.path)
+            root.end(error)
+            tracer.finish(root)